@@ -5,6 +5,13 @@ from mixer.backend.django import mixer as _mixer
 from posts.models import Post, Group
 
 
+@pytest.fixture(autouse=True)
+def inline_thumbnails(settings):
+    # Миниатюры создаются в потоке запроса: из пула они дописывались бы
+    # во временный MEDIA_ROOT, когда mock_media его уже удаляет.
+    settings.THUMBNAIL_WORKERS = 0
+
+
 @pytest.fixture()
 def mock_media(settings):
     with tempfile.TemporaryDirectory() as temp_directory:
@@ -0,0 +1,152 @@
+import orjson
+from django.http import HttpResponse
+from posts.models import Comment, Group, Post, User
+
+
+class ApiError(Exception):
+    """Ошибка запроса к API: клиент получает её текст с кодом status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def json_response(data, status=200):
+    """Ответ в JSON через orjson: он в разы быстрее json и сам
+    понимает даты (ISO 8601 с микросекундами и смещением +00:00).
+    """
+    return HttpResponse(
+        orjson.dumps(data), status=status, content_type='application/json'
+    )
+
+
+class Resource:
+    """Ресурс API: поля ответа и столбцы модели, из которых они
+    берутся. Строки читаются через values(), без создания моделей.
+
+    relations — поля-ссылки, которые ?include= заменяет объектами
+    другого ресурса: они подгружаются одним запросом на связь для
+    всей страницы. convert — преобразования значений столбцов.
+    scope — область версий (posts.cache) ресурса, встроенного через
+    include: правка его объектов меняет ETag лент со встроенными
+    объектами (см. api.signals).
+    """
+
+    def __init__(self, model, fields, relations=None, convert=None,
+                 scope=None):
+        self.model = model
+        self.fields = fields
+        self.relations = relations or {}
+        self.convert = convert or {}
+        self.scope = scope
+
+    def parse(self, request):
+        """Поля из ?fields= (по умолчанию все) и связи из ?include=.
+        Подгружаемая связь всегда попадает в ответ.
+        """
+        fields = self._names(request, 'fields', self.fields)
+        fields = fields or list(self.fields)
+        include = self._names(request, 'include', self.relations)
+        fields += [name for name in include if name not in fields]
+        return fields, include
+
+    def _names(self, request, param, allowed):
+        names = [
+            name.strip() for name in request.GET.get(param, '').split(',')
+            if name.strip()
+        ]
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            raise ApiError(
+                f'Неизвестные значения {param}: {", ".join(unknown)}. '
+                f'Допустимые: {", ".join(allowed)}.'
+            )
+        return list(dict.fromkeys(names))
+
+    def columns(self, fields, extra=()):
+        """Столбцы для values(): нужные полям fields и extra."""
+        return list(dict.fromkeys(
+            [*extra, *(self.fields[name] for name in fields)]
+        ))
+
+    def render(self, row, fields, included=None):
+        """Объект ответа из строки values()."""
+        included = included or {}
+        data = {}
+        for name in fields:
+            value = row[self.fields[name]]
+            if name in included:
+                value = included[name].get(value)
+            elif name in self.convert:
+                value = self.convert[name](value)
+            data[name] = value
+        return data
+
+    def render_many(self, rows, fields, include=()):
+        """Объекты ответа для строк rows со связями include."""
+        included = {}
+        for name in include:
+            column = self.fields[name]
+            included[name] = self.relations[name].fetch(
+                {row[column] for row in rows if row[column] is not None}
+            )
+        return [self.render(row, fields, included) for row in rows]
+
+    def fetch(self, pks):
+        """Объекты ресурса с первичными ключами pks одним запросом:
+        словарь {pk: объект}.
+        """
+        if not pks:
+            return {}
+        fields = list(self.fields)
+        rows = self.model.objects.filter(pk__in=pks).values(
+            *self.columns(fields, extra=('pk',))
+        )
+        return {row['pk']: self.render(row, fields) for row in rows}
+
+
+def image_url(name):
+    return Post.image.field.storage.url(name) if name else None
+
+
+AUTHOR = Resource(User, {
+    'id': 'id',
+    'username': 'username',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+}, scope='authors')
+
+GROUP = Resource(Group, {
+    'id': 'id',
+    'slug': 'slug',
+    'title': 'title',
+    'description': 'description',
+}, scope='groups')
+
+POST = Resource(
+    Post,
+    {
+        'id': 'id',
+        'text': 'text',
+        'pub_date': 'pub_date',
+        'edited': 'edited',
+        'author': 'author_id',
+        'group': 'group_id',
+        'image': 'image',
+        'comments_count': 'comments_count',
+    },
+    relations={'author': AUTHOR, 'group': GROUP},
+    convert={'image': image_url},
+)
+
+COMMENT = Resource(
+    Comment,
+    {
+        'id': 'id',
+        'post': 'post_id',
+        'author': 'author_id',
+        'text': 'text',
+        'pub_date': 'pub_date',
+    },
+    relations={'author': AUTHOR},
+)
@@ -0,0 +1,48 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from posts.cache import bump_feed_versions
+from posts.models import Group, User
+from .resources import AUTHOR, GROUP
+
+
+def changes_resource(resource, created, update_fields):
+    """Меняет ли сохранение объекта поля, которые отдаёт resource.
+    Новый объект ещё не встроен ни в один ответ.
+    """
+    if created:
+        return False
+    if update_fields is None:
+        return True
+    return bool(set(update_fields) & set(resource.fields.values()))
+
+
+@receiver(post_save, sender=User)
+def invalidate_authors(sender, instance, created, update_fields, **kwargs):
+    """Сбрасывает ETag лент API после правки автора. Вход на сайт
+    обновляет только last_login и ленты не трогает.
+    """
+    if not kwargs.get('raw') and changes_resource(
+        AUTHOR, created, update_fields
+    ):
+        bump_feed_versions([AUTHOR.scope])
+
+
+@receiver(post_save, sender=Group)
+def invalidate_groups(sender, instance, created, update_fields, **kwargs):
+    """Сбрасывает ETag лент API после правки группы."""
+    if not kwargs.get('raw') and changes_resource(
+        GROUP, created, update_fields
+    ):
+        bump_feed_versions([GROUP.scope])
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_author(sender, instance, **kwargs):
+    """Удалённый автор пропадает из встроенных объектов."""
+    bump_feed_versions([AUTHOR.scope])
+
+
+@receiver(post_delete, sender=Group)
+def invalidate_deleted_group(sender, instance, **kwargs):
+    """Удалённая группа пропадает из встроенных объектов."""
+    bump_feed_versions([GROUP.scope])
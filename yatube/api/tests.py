@@ -0,0 +1,197 @@
+import json
+from http import HTTPStatus
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='Author', first_name='Лев'
+        )
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.groups = [
+            Group.objects.create(title=f'Group {number}', slug=f'g-{number}')
+            for number in range(2)
+        ]
+        for number in range(settings.PAGES_LIMIT + 3):
+            cls.post = Post.objects.create(
+                text=f'Test text {number}',
+                author=cls.author if number % 2 else cls.reader,
+                group=cls.groups[number % 2],
+            )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Test comment'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(ApiTests.reader)
+
+    def get_json(self, url, data=None, client=None, status=HTTPStatus.OK):
+        response = (client or self.guest_client).get(url, data)
+        self.assertEqual(response.status_code, status)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return json.loads(response.content)
+
+    def test_posts_are_paginated_by_cursor(self):
+        """Лента постов отдаётся страницами по курсору, битый курсор —
+        ошибка 400.
+        """
+        url = reverse('api:posts')
+        first = self.get_json(url)
+        self.assertEqual(len(first['results']), settings.PAGES_LIMIT)
+        self.assertEqual(first['results'][0]['id'], ApiTests.post.pk)
+        self.assertIsNone(first['previous'])
+        second = self.get_json(url, {'after': first['next']})
+        self.assertEqual(len(second['results']), 3)
+        self.assertIsNone(second['next'])
+        ids = [post['id'] for post in first['results'] + second['results']]
+        self.assertEqual(
+            ids, list(Post.objects.values_list('id', flat=True))
+        )
+        for param in ('after', 'before'):
+            with self.subTest(param=param):
+                data = self.get_json(
+                    url, {param: 'broken'}, status=HTTPStatus.BAD_REQUEST
+                )
+                self.assertIn(param, data['error'])
+
+    def test_sparse_fields(self):
+        """?fields= оставляет в ответе только перечисленные поля,
+        неизвестное поле — ошибка 400.
+        """
+        data = self.get_json(reverse('api:posts'), {'fields': 'id,text'})
+        for post in data['results']:
+            self.assertEqual(set(post), {'id', 'text'})
+        data = self.get_json(
+            reverse('api:posts'), {'fields': 'id,password'},
+            status=HTTPStatus.BAD_REQUEST,
+        )
+        self.assertIn('password', data['error'])
+
+    def test_include_uses_one_query_per_relation(self):
+        """include=author,group подгружает связи одним запросом
+        на связь, сколько бы постов ни было на странице.
+        """
+        url = reverse('api:posts')
+        with self.assertNumQueries(3):
+            data = self.get_json(url, {'include': 'author,group'})
+        for post in data['results']:
+            self.assertIn(post['author']['username'], ('Author', 'Reader'))
+            self.assertIn(post['group']['slug'], ('g-0', 'g-1'))
+        data = self.get_json(url, {'fields': 'id', 'include': 'author'})
+        self.assertEqual(set(data['results'][0]), {'id', 'author'})
+        self.assertEqual(
+            data['results'][0]['author']['first_name'],
+            ApiTests.post.author.first_name,
+        )
+
+    def test_post_and_comments(self):
+        """Пост и его комментарии; несуществующий пост — 404 в JSON."""
+        post = ApiTests.post
+        data = self.get_json(reverse('api:post', args=(post.pk,)))
+        self.assertEqual(data['text'], post.text)
+        self.assertEqual(data['pub_date'], post.pub_date.isoformat())
+        self.assertEqual(data['comments_count'], 1)
+        self.assertIsNone(data['image'])
+        data = self.get_json(
+            reverse('api:post_comments', args=(post.pk,)),
+            {'include': 'author'},
+        )
+        self.assertEqual(data['results'][0]['text'], 'Test comment')
+        self.assertEqual(data['results'][0]['author']['username'], 'Reader')
+        self.get_json(
+            reverse('api:post', args=(post.pk + 100,)),
+            status=HTTPStatus.NOT_FOUND,
+        )
+
+    def test_group_and_author_feeds(self):
+        """Ленты группы и автора, данные группы и статистика автора."""
+        group = ApiTests.groups[1]
+        data = self.get_json(reverse('api:groups'))
+        self.assertEqual(
+            [item['slug'] for item in data['results']], ['g-0', 'g-1']
+        )
+        data = self.get_json(reverse('api:group', args=(group.slug,)))
+        self.assertEqual(data['title'], group.title)
+        data = self.get_json(reverse('api:group_posts', args=(group.slug,)))
+        self.assertEqual(
+            {post['group'] for post in data['results']}, {group.pk}
+        )
+        author = ApiTests.author
+        data = self.get_json(reverse('api:author', args=(author.username,)))
+        self.assertEqual(
+            data['stats']['posts_count'], author.post_set.count()
+        )
+        data = self.get_json(
+            reverse('api:author_posts', args=(author.username,))
+        )
+        self.assertEqual(
+            {post['author'] for post in data['results']}, {author.pk}
+        )
+        self.get_json(
+            reverse('api:author_posts', args=('nobody',)),
+            status=HTTPStatus.NOT_FOUND,
+        )
+
+    def test_follow_feed_requires_login(self):
+        """Лента подписок — только для вошедших."""
+        url = reverse('api:follow')
+        self.get_json(url, status=HTTPStatus.UNAUTHORIZED)
+        data = self.get_json(url, client=self.reader_client)
+        self.assertEqual(
+            {post['author'] for post in data['results']},
+            {ApiTests.author.pk},
+        )
+
+    def test_feeds_answer_conditional_requests(self):
+        """Ленты API отвечают 304, пока не изменились."""
+        url = reverse('api:posts')
+        response = self.guest_client.get(url)
+        response = self.guest_client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_embedded_objects_change_etag(self):
+        """Правка автора или группы, встроенных через include, меняет
+        ETag лент; вход на сайт — нет.
+        """
+        url = reverse('api:post', args=(ApiTests.post.pk,))
+        data = {'include': 'author,group'}
+        etag = self.guest_client.get(url, data)['ETag']
+        self.reader_client.force_login(ApiTests.author)
+        response = self.guest_client.get(url, data, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        for name, model, pk, field in (
+            ('author', User, ApiTests.post.author_id, 'first_name'),
+            ('group', Group, ApiTests.post.group_id, 'title'),
+        ):
+            with self.subTest(include=name):
+                instance = model.objects.get(pk=pk)
+                setattr(instance, field, 'Changed')
+                instance.save()
+                response = self.guest_client.get(
+                    url, data, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(
+                    json.loads(response.content)[name][field], 'Changed'
+                )
+                etag = response['ETag']
+
+    def test_api_is_read_only(self):
+        """Методы, кроме GET и HEAD, не поддерживаются."""
+        response = self.reader_client.post(reverse('api:posts'))
+        self.assertEqual(
+            response.status_code, HTTPStatus.METHOD_NOT_ALLOWED
+        )
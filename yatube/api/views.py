@@ -0,0 +1,174 @@
+from functools import wraps
+from django.conf import settings
+from django.http import Http404
+from core.paginators import CursorPaginator
+from posts.cache import conditional_feed
+from posts.models import (AuthorStats, Comment, Group, Post,
+                          TimelineEntry, User)
+from .resources import (AUTHOR, COMMENT, GROUP, POST, ApiError,
+                        json_response)
+
+
+def api_view(view):
+    """View API только для чтения: ошибки отдаются в JSON,
+    а не страницами сайта.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            response = json_response(
+                {'error': 'API только для чтения.'}, status=405
+            )
+            response['Allow'] = 'GET, HEAD'
+            return response
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            return json_response({'error': str(error)}, status=error.status)
+        except Http404:
+            return json_response({'error': 'Не найдено.'}, status=404)
+    return wrapper
+
+
+def get_limit(request):
+    """Размер страницы из ?limit=, не больше API_MAX_LIMIT."""
+    limit = request.GET.get('limit')
+    if limit is None:
+        return settings.PAGES_LIMIT
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if not 0 < limit <= settings.API_MAX_LIMIT:
+        raise ApiError(
+            f'limit — целое число от 1 до {settings.API_MAX_LIMIT}.'
+        )
+    return limit
+
+
+def paginated(request, resource, queryset, ordering=('-pub_date', '-id'),
+              window=None):
+    """Страница ресурса по курсору из after/before; битый курсор —
+    ошибка 400, а не первая страница.
+
+    Выбираются только столбцы запрошенных полей и ключа сортировки,
+    связи из include подгружаются одним запросом каждая.
+    """
+    fields, include = resource.parse(request)
+    key = tuple(field.lstrip('-') for field in ordering)
+    paginator = CursorPaginator(
+        queryset.values(*resource.columns(fields, extra=key)),
+        get_limit(request),
+        ordering=ordering,
+        window=window,
+    )
+    cursors = {
+        param: request.GET.get(param) for param in ('after', 'before')
+    }
+    for param, cursor in cursors.items():
+        if cursor and paginator.decode_cursor(cursor) is None:
+            raise ApiError(f'Неверный курсор {param}.')
+    page = paginator.get_cursor_page(**cursors)
+    return json_response({
+        'results': resource.render_many(page.object_list, fields, include),
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+def detail(request, resource, queryset):
+    """Один объект ресурса из queryset или 404."""
+    fields, include = resource.parse(request)
+    rows = list(queryset.values(*resource.columns(fields))[:1])
+    if not rows:
+        raise Http404
+    return json_response(resource.render_many(rows, fields, include)[0])
+
+
+def get_pk(queryset, **lookup):
+    """Первичный ключ объекта по lookup или 404."""
+    pk = queryset.filter(**lookup).values_list('pk', flat=True).first()
+    if pk is None:
+        raise Http404
+    return pk
+
+
+@api_view
+@conditional_feed('index', AUTHOR.scope, GROUP.scope)
+def posts(request):
+    return paginated(request, POST, Post.objects.all())
+
+
+@api_view
+@conditional_feed('post:{post_id}', AUTHOR.scope, GROUP.scope)
+def post(request, post_id):
+    return detail(request, POST, Post.objects.filter(pk=post_id))
+
+
+@api_view
+@conditional_feed('post:{post_id}', AUTHOR.scope)
+def post_comments(request, post_id):
+    get_pk(Post.objects, pk=post_id)
+    return paginated(
+        request, COMMENT, Comment.objects.filter(post_id=post_id),
+        ordering=('pub_date', 'id'),
+    )
+
+
+@api_view
+def groups(request):
+    fields, _ = GROUP.parse(request)
+    rows = Group.objects.order_by('title').values(*GROUP.columns(fields))
+    return json_response({'results': GROUP.render_many(rows, fields)})
+
+
+@api_view
+def group(request, slug):
+    return detail(request, GROUP, Group.objects.filter(slug=slug))
+
+
+@api_view
+@conditional_feed('group:{slug}', AUTHOR.scope, GROUP.scope)
+def group_posts(request, slug):
+    group_id = get_pk(Group.objects, slug=slug)
+    return paginated(request, POST, Post.objects.filter(group_id=group_id))
+
+
+@api_view
+def author(request, username):
+    """Автор и его статистика."""
+    fields, _ = AUTHOR.parse(request)
+    try:
+        user = User.objects.select_related('stats').get(username=username)
+    except User.DoesNotExist:
+        raise Http404
+    stats = AuthorStats.objects.for_author(user)
+    data = AUTHOR.render(
+        {column: getattr(user, column) for column in AUTHOR.columns(fields)},
+        fields,
+    )
+    data['stats'] = {
+        'posts_count': stats.posts_count,
+        'comments_count': stats.comments_count,
+        'followers_count': stats.followers_count,
+        'following_count': stats.following_count,
+    }
+    return json_response(data)
+
+
+@api_view
+@conditional_feed('author:{username}', AUTHOR.scope, GROUP.scope)
+def author_posts(request, username):
+    author_id = get_pk(User.objects, username=username)
+    return paginated(request, POST, Post.objects.filter(author_id=author_id))
+
+
+@api_view
+def follow(request):
+    """Лента подписок вошедшего пользователя."""
+    if not request.user.is_authenticated:
+        raise ApiError('Нужно войти на сайт.', status=401)
+    return paginated(
+        request, POST, TimelineEntry.objects.posts_for(request.user),
+        window=TimelineEntry.objects.window_for(request.user),
+    )
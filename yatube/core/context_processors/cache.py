@@ -0,0 +1,8 @@
+from django.conf import settings
+
+
+def cache_limits(request):
+    """Добавляет в контекст время жизни кэшируемых фрагментов шаблонов."""
+    return {
+        'card_cache_limit': settings.CARD_CACHE_LIMIT,
+    }
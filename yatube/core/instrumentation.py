@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import (DjangoTemplates, Template,
+                                             reraise)
+from .metrics import REQUEST_DURATION, REQUEST_QUERIES, registry
+
+
+logger = logging.getLogger('yatube.requests')
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """View выполнил больше запросов, чем указано в QUERY_BUDGETS."""
+
+
+class RequestStats:
+    """Замеры одного запроса."""
+
+    def __init__(self, view_name):
+        self.view_name = view_name
+        self.queries = 0
+        self.unbudgeted_queries = 0
+        self.unbudgeted_depth = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self.response_size = None
+        self.status_code = None
+        self.rendering = False
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            if self.unbudgeted_depth:
+                self.unbudgeted_queries += 1
+
+    def as_dict(self):
+        return {
+            'view': self.view_name,
+            'status': self.status_code,
+            'queries': self.queries,
+            'unbudgeted_queries': self.unbudgeted_queries,
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'total_ms': round(self.total_time * 1000, 2),
+            'bytes': self.response_size,
+        }
+
+
+def current_stats():
+    """Замеры запроса, который обрабатывается в этом потоке, или None."""
+    return getattr(_local, 'stats', None)
+
+
+@contextmanager
+def unbudgeted():
+    """Запросы внутри блока считаются в замерах, но не входят в бюджет
+    view из QUERY_BUDGETS. Так помечается разовая работа, которую
+    следующие запросы уже не повторят: пересчёт отсутствующей
+    статистики, создание ещё не готовых миниатюр.
+    """
+    stats = current_stats()
+    if stats is None:
+        yield
+        return
+    stats.unbudgeted_depth += 1
+    try:
+        yield
+    finally:
+        stats.unbudgeted_depth -= 1
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = current_stats()
+        if stats is None or stats.rendering:
+            return super().render(context, request)
+        stats.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+            stats.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблонизатор Django, который учитывает время рендера в замерах
+    текущего запроса. Шаблоны, отрендеренные внутри другого,
+    отдельно не считаются.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(
+                self.engine.get_template(template_name), self
+            )
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def report(stats):
+    """Пишет замеры запроса в лог yatube.requests и в метрики."""
+    logger.info(
+        '%(view)s %(status)s: %(queries)s запросов, SQL %(sql_ms)s мс, '
+        'шаблоны %(template_ms)s мс, всего %(total_ms)s мс, '
+        '%(bytes)s байт',
+        stats.as_dict(), extra={'request_stats': stats.as_dict()},
+    )
+    REQUEST_DURATION.observe(
+        stats.total_time, view=stats.view_name, status=stats.status_code
+    )
+    REQUEST_QUERIES.inc(stats.queries, view=stats.view_name)
+    registry.flush()
+
+
+class RequestStatsMiddleware:
+    """Считает для каждого view число и время SQL-запросов, время
+    рендера шаблонов и размер ответа и передаёт их в report.
+
+    Превышение бюджета запросов из QUERY_BUDGETS пишется в лог,
+    а при QUERY_BUDGETS_ENFORCE вызывает QueryBudgetExceeded —
+    так тесты падают на view, которые стали делать лишние запросы.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats(view_name=None)
+        _local.stats = stats
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(stats.execute_wrapper)
+                    )
+                response = self.get_response(request)
+        finally:
+            _local.stats = None
+        stats.total_time = time.perf_counter() - started
+        if request.resolver_match is None:
+            return response
+        stats.view_name = request.resolver_match.view_name
+        stats.status_code = response.status_code
+        if not response.streaming:
+            stats.response_size = len(response.content)
+        report(stats)
+        self.check_budget(stats)
+        # Замеры доступны тестам и бенчмарку через ответ тест-клиента.
+        response.request_stats = stats
+        return response
+
+    def check_budget(self, stats):
+        budget = settings.QUERY_BUDGETS.get(stats.view_name)
+        queries = stats.queries - stats.unbudgeted_queries
+        if budget is None or queries <= budget:
+            return
+        message = (
+            f'{stats.view_name}: {queries} SQL-запросов '
+            f'при бюджете {budget}'
+        )
+        if settings.QUERY_BUDGETS_ENFORCE:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,200 @@
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPRedirectHandler, Request, build_opener
+from wsgiref.simple_server import WSGIServer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from .benchmark_views import (PERCENTILES, QuietHandler, get_scenarios,
+                              percentile)
+
+
+READ_SCENARIOS = (
+    'index', 'group_posts', 'profile', 'post_detail', 'follow_index',
+)
+WRITE_SCENARIOS = ('post_create:post', 'add_comment')
+
+
+class PooledWSGIServer(WSGIServer):
+    """WSGI-сервер с постоянным пулом потоков, как у gunicorn
+    с --threads: соединения с базой живут в потоках пула и с
+    CONN_MAX_AGE переиспользуются между запросами.
+    """
+
+    request_queue_size = 128
+
+    def __init__(self, address, handler_class, threads):
+        super().__init__(address, handler_class)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_pooled, request, client_address)
+
+    def process_pooled(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+
+
+class NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает ленты и страницы постов смесью чтений и записей '
+        'из нескольких потоков через локальный WSGI-сервер и выводит '
+        'пропускную способность и задержки. Записи сохраняются — '
+        'запускайте на копии базы, заполненной seed_yatube. '
+        'С --legacy-sqlite SQLite работает как без SQLITE_PRAGMAS: '
+        'журнал отката и новое соединение на каждый запрос.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Сколько клиентов шлют запросы одновременно.',
+        )
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='Сколько потоков обрабатывают запросы на сервере.',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Сколько секунд длится нагрузка.',
+        )
+        parser.add_argument(
+            '--write-share', type=float, default=0.2,
+            help='Доля запросов на запись.',
+        )
+        parser.add_argument('--legacy-sqlite', action='store_true')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.options = options
+        database = connections.databases['default']
+        saved_max_age = max_age = database.get('CONN_MAX_AGE', 0)
+        pragmas = settings.SQLITE_PRAGMAS
+        if options['legacy_sqlite']:
+            pragmas = {'journal_mode': 'DELETE'}
+            max_age = 0
+        database['CONN_MAX_AGE'] = max_age
+        try:
+            # Прагмы применяются к новым соединениям.
+            connections.close_all()
+            with override_settings(DEBUG=False, SQLITE_PRAGMAS=pragmas):
+                results = self.run()
+        finally:
+            database['CONN_MAX_AGE'] = saved_max_age
+        profile = ', '.join(
+            f'{name}={value}' for name, value in pragmas.items()
+        )
+        self.stdout.write(f'{profile}; CONN_MAX_AGE={max_age}')
+        self.print_results(results)
+
+    def run(self):
+        reader, scenarios = get_scenarios()
+        scenarios = {scenario[0]: scenario for scenario in scenarios}
+        client = Client()
+        client.force_login(reader)
+        # CSRF-кука заводится, когда форма берёт токен.
+        client.get(reverse('posts:post_create'))
+        csrf_token = client.cookies[settings.CSRF_COOKIE_NAME].value
+        self.headers = {
+            'Cookie': '; '.join(
+                f'{name}={morsel.value}'
+                for name, morsel in client.cookies.items()
+            ),
+            'X-CSRFToken': csrf_token,
+        }
+        server = PooledWSGIServer(
+            ('127.0.0.1', 0), QuietHandler, self.options['threads']
+        )
+        server.set_app(get_wsgi_application())
+        self.base_url = f'http://127.0.0.1:{server.server_port}'
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        results = {'read': [], 'write': [], 'errors': []}
+        deadline = time.monotonic() + self.options['duration']
+        try:
+            workers = [
+                threading.Thread(
+                    target=self.work,
+                    args=(scenarios, deadline, results,
+                          random.Random(self.options['seed'] + number)),
+                )
+                for number in range(self.options['concurrency'])
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            server.shutdown()
+            server.server_close()
+        return results
+
+    def work(self, scenarios, deadline, results, rng):
+        opener = build_opener(NoRedirect)
+        while time.monotonic() < deadline:
+            write = rng.random() < self.options['write_share']
+            name = rng.choice(WRITE_SCENARIOS if write else READ_SCENARIOS)
+            _, method, url, data, _ = scenarios[name]
+            request = Request(
+                self.base_url + url,
+                data=urlencode(data).encode() if method == 'post' else None,
+                headers=self.headers,
+            )
+            started = time.perf_counter()
+            try:
+                with opener.open(request) as reply:
+                    reply.read()
+                    status = reply.status
+            except HTTPError as error:
+                status = error.code
+            except URLError as error:
+                status = str(error.reason)
+            elapsed = time.perf_counter() - started
+            if not isinstance(status, int) or status >= 400:
+                results['errors'].append(f'{name}: {status}')
+            else:
+                results['write' if write else 'read'].append(elapsed)
+
+    def print_results(self, results):
+        duration = self.options['duration']
+        self.stdout.write(
+            f'{"":<8}{"запросов":>10}{"в секунду":>11}'
+            + ''.join(f'{f"p{rank}_ms":>9}' for rank in PERCENTILES)
+        )
+        rows = (
+            ('чтение', results['read']),
+            ('запись', results['write']),
+            ('всего', results['read'] + results['write']),
+        )
+        for title, timings in rows:
+            line = f'{title:<8}{len(timings):>10}'
+            line += f'{len(timings) / duration:>11.1f}'
+            if timings:
+                line += ''.join(
+                    f'{percentile(timings, rank) * 1000:>9.1f}'
+                    for rank in PERCENTILES
+                )
+            self.stdout.write(line)
+        self.stdout.write(f'ошибок: {len(results["errors"])}')
+        for error, count in Counter(results['errors']).most_common():
+            self.stdout.write(f'  {error} — {count}')
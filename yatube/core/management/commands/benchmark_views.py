@@ -0,0 +1,298 @@
+import json
+import math
+import threading
+import time
+import tracemalloc
+from urllib.request import Request, urlopen
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from posts.models import AuthorStats, Group, Post
+
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Процентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(rank / 100 * len(ordered)) - 1, 0)]
+
+
+def get_scenarios():
+    """Читатель и сценарии: имя, метод, адрес, данные формы, нужен ли
+    вход читателя.
+    Объекты берутся самые нагруженные: автор с наибольшим числом
+    постов, читатель с наибольшим числом подписок.
+    """
+    author = AuthorStats.objects.select_related('user').order_by(
+        '-posts_count'
+    ).first()
+    reader = AuthorStats.objects.select_related('user').order_by(
+        '-following_count'
+    ).first()
+    post = Post.objects.order_by('-comments_count').first()
+    group = Group.objects.annotate(total=Count('posts')).order_by(
+        '-total'
+    ).first()
+    if None in (author, reader, post, group):
+        raise CommandError(
+            'В базе нет постов, групп или авторов: заполните её '
+            'командой seed_yatube.'
+        )
+    username = author.user.username
+    return reader.user, [
+        ('index', 'get', reverse('posts:index'), None, False),
+        ('group_posts', 'get', reverse(
+            'posts:group_list', kwargs={'slug': group.slug}
+        ), None, False),
+        ('profile', 'get', reverse(
+            'posts:profile', kwargs={'username': username}
+        ), None, False),
+        ('post_detail', 'get', reverse(
+            'posts:post_detail', kwargs={'post_id': post.pk}
+        ), None, False),
+        ('follow_index', 'get', reverse('posts:follow_index'), None, True),
+        ('api_posts', 'get', reverse('api:posts') + '?include=author,group',
+         None, False),
+        ('api_follow', 'get', reverse('api:follow'), None, True),
+        ('post_create', 'get', reverse('posts:post_create'), None, True),
+        ('post_create:post', 'post', reverse('posts:post_create'),
+         {'text': 'Benchmark post'}, True),
+        ('add_comment', 'post', reverse(
+            'posts:add_comment', kwargs={'post_id': post.pk}
+        ), {'text': 'Benchmark comment'}, True),
+        ('login', 'get', reverse('users:login'), None, False),
+        ('login:post', 'post', reverse('users:login'), {
+            'username': reader.user.username, 'password': 'password',
+        }, False),
+        ('signup', 'get', reverse('users:signup'), None, False),
+        ('password_change', 'get', reverse('users:password_change'),
+         None, True),
+        ('password_reset', 'get', reverse('users:password_reset_form'),
+         None, False),
+        ('about_author', 'get', reverse('about:author'), None, False),
+        ('about_tech', 'get', reverse('about:tech'), None, False),
+    ]
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет view posts, users и about на заполненной базе '
+        '(см. seed_yatube): p50/p95/p99 времени ответа, SQL-запросы '
+        'и память на запрос. С --baseline сравнивает с сохранённым '
+        'замером и завершается ошибкой при регрессии.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Сколько замеренных запросов делать на каждый view.',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Сколько запросов делать до замера.',
+        )
+        parser.add_argument(
+            '--alloc-requests', type=int, default=5,
+            help='Сколько запросов замерять tracemalloc (0 — не замерять).',
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэши перед каждым запросом.',
+        )
+        parser.add_argument(
+            '--server', action='store_true',
+            help='Отправлять GET-запросы в локальный WSGI-сервер; '
+                 'SQL-запросы и память при этом не замеряются.',
+        )
+        parser.add_argument(
+            '--only', nargs='+', metavar='SCENARIO',
+            help='Замерить только перечисленные сценарии.',
+        )
+        parser.add_argument('--baseline', help='JSON прошлого замера.')
+        parser.add_argument(
+            '--save-baseline', help='Куда сохранить этот замер.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95 и памяти относительно baseline.',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        # Без debug_toolbar и журнала запросов DEBUG.
+        with override_settings(DEBUG=False):
+            self.reader, scenarios = get_scenarios()
+            if options['only']:
+                scenarios = [s for s in scenarios if s[0] in options['only']]
+            if options['server']:
+                scenarios = [s for s in scenarios if s[1] == 'get']
+                results = self.run_server(scenarios)
+            else:
+                results = {
+                    scenario[0]: self.run_client(*scenario[1:])
+                    for scenario in scenarios
+                }
+        self.print_results(results)
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as file:
+                json.dump(results, file, indent=2, ensure_ascii=False)
+        if options['baseline']:
+            self.compare(results, options['baseline'])
+
+    def clear_caches(self):
+        if self.options['cold']:
+            for alias in settings.CACHES:
+                caches[alias].clear()
+
+    def run_client(self, method, url, data, login):
+        client = Client()
+        if login:
+            client.force_login(self.reader)
+        request = getattr(client, method)
+
+        def send():
+            # Пишущие запросы откатываются, чтобы не менять базу.
+            with transaction.atomic():
+                response = request(url, data) if data else request(url)
+                transaction.set_rollback(True)
+            return response
+
+        for _ in range(self.options['warmup']):
+            send()
+        timings, queries = [], []
+        for _ in range(self.options['requests']):
+            self.clear_caches()
+            started = time.perf_counter()
+            response = send()
+            timings.append(time.perf_counter() - started)
+            stats = getattr(response, 'request_stats', None)
+            queries.append(stats.queries if stats else 0)
+        result = self.summarize(timings, response.status_code)
+        result['queries'] = max(queries)
+        if self.options['alloc_requests']:
+            result['alloc_kib'] = self.measure_allocations(send)
+        return result
+
+    def measure_allocations(self, send):
+        """Медиана пика памяти на запрос по tracemalloc, КиБ."""
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(self.options['alloc_requests']):
+                self.clear_caches()
+                if hasattr(tracemalloc, 'reset_peak'):
+                    tracemalloc.reset_peak()
+                else:
+                    # reset_peak появился в Python 3.9; clear_traces
+                    # сбрасывает и текущий объём, и пик.
+                    tracemalloc.clear_traces()
+                before = tracemalloc.get_traced_memory()[0]
+                send()
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+        return round(percentile(peaks, 50) / 1024, 1)
+
+    def run_server(self, scenarios):
+        server = make_server(
+            '127.0.0.1', 0, get_wsgi_application(), handler_class=QuietHandler
+        )
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        client = Client()
+        client.force_login(self.reader)
+        cookie = (
+            f'{settings.SESSION_COOKIE_NAME}='
+            f'{client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        )
+        results = {}
+        try:
+            for name, _, url, _, login in scenarios:
+                headers = {'Cookie': cookie} if login else {}
+                address = f'http://127.0.0.1:{server.server_port}{url}'
+
+                def send():
+                    with urlopen(Request(address, headers=headers)) as reply:
+                        reply.read()
+                        return reply.status
+
+                for _ in range(self.options['warmup']):
+                    send()
+                timings = []
+                for _ in range(self.options['requests']):
+                    self.clear_caches()
+                    started = time.perf_counter()
+                    status = send()
+                    timings.append(time.perf_counter() - started)
+                results[name] = self.summarize(timings, status)
+        finally:
+            server.shutdown()
+            server.server_close()
+        return results
+
+    def summarize(self, timings, status):
+        result = {
+            f'p{rank}_ms': round(percentile(timings, rank) * 1000, 2)
+            for rank in PERCENTILES
+        }
+        result['status'] = status
+        return result
+
+    def print_results(self, results):
+        columns = ('p50_ms', 'p95_ms', 'p99_ms', 'queries', 'alloc_kib')
+        self.stdout.write(
+            f'{"сценарий":<20}' + ''.join(f'{c:>11}' for c in columns)
+            + '  код'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<20}'
+                + ''.join(f'{result.get(c, "-"):>11}' for c in columns)
+                + f'  {result["status"]}'
+            )
+
+    def compare(self, results, path):
+        """Сравнивает замер с baseline и падает при регрессиях."""
+        with open(path) as file:
+            baseline = json.load(file)
+        tolerance = 1 + self.options['tolerance']
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if not base:
+                continue
+            if result['p95_ms'] > base['p95_ms'] * tolerance:
+                regressions.append(
+                    f'{name}: p95 {result["p95_ms"]} мс, '
+                    f'было {base["p95_ms"]} мс'
+                )
+            if result.get('queries', 0) > base.get('queries', math.inf):
+                regressions.append(
+                    f'{name}: {result["queries"]} SQL-запросов, '
+                    f'было {base["queries"]}'
+                )
+            if result.get('alloc_kib', 0) > base.get(
+                'alloc_kib', math.inf
+            ) * tolerance:
+                regressions.append(
+                    f'{name}: память {result["alloc_kib"]} КиБ, '
+                    f'было {base["alloc_kib"]} КиБ'
+                )
+        if regressions:
+            raise CommandError(
+                'Регрессии относительно baseline:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
@@ -0,0 +1,178 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from django.conf import settings
+
+
+# Границы корзин гистограмм времени, в секундах.
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'),
+)
+
+
+class Registry:
+    """Метрики процесса в формате Prometheus.
+
+    Если задан METRICS_DIR, каждый процесс не чаще раза
+    в METRICS_FLUSH_INTERVAL секунд и при выходе сбрасывает свои значения
+    в файл каталога, а collect() суммирует файлы всех процессов:
+    так /metrics любого WSGI-воркера показывает общие числа.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.values = {}
+        self.flushed_at = 0
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add(self, name, labels, amounts):
+        key = (name, labels)
+        with self.lock:
+            values = self.values.setdefault(key, [0] * len(amounts))
+            for index, amount in enumerate(amounts):
+                values[index] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return [
+                [name, list(labels), list(values)]
+                for (name, labels), values in self.values.items()
+            ]
+
+    def _path(self, pid):
+        return os.path.join(settings.METRICS_DIR, f'metrics-{pid}.json')
+
+    def flush(self, force=False):
+        """Сохраняет значения процесса в METRICS_DIR."""
+        if not settings.METRICS_DIR:
+            return
+        now = time.monotonic()
+        interval = settings.METRICS_FLUSH_INTERVAL
+        if not force and now - self.flushed_at < interval:
+            return
+        self.flushed_at = now
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=settings.METRICS_DIR)
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(temporary, self._path(os.getpid()))
+
+    def collect(self):
+        """Значения всех процессов: свои — текущие, чужие — из файлов."""
+        totals = {}
+        entries = self.snapshot()
+        own = self._path(os.getpid()) if settings.METRICS_DIR else None
+        if settings.METRICS_DIR and os.path.isdir(settings.METRICS_DIR):
+            for name in os.listdir(settings.METRICS_DIR):
+                path = os.path.join(settings.METRICS_DIR, name)
+                if not name.startswith('metrics-') or path == own:
+                    continue
+                try:
+                    with open(path) as file:
+                        entries.extend(json.load(file))
+                except (OSError, ValueError):
+                    continue
+        for name, labels, values in entries:
+            key = (name, tuple(map(tuple, labels)))
+            total = totals.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                total[index] += value
+        return totals
+
+    def render(self):
+        """Текст для /metrics в формате экспозиции Prometheus."""
+        totals = self.collect()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for (name, labels), values in sorted(totals.items()):
+                if name == metric.name:
+                    lines.extend(metric.samples(dict(labels), values))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+atexit.register(registry.flush, force=True)
+
+
+def _format_labels(labels):
+    pairs = ','.join(
+        '{}="{}"'.format(
+            key, str(value).replace('\\', r'\\').replace('"', r'\"')
+        )
+        for key, value in labels.items()
+    )
+    return '{' + pairs + '}' if pairs else ''
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        registry.register(self)
+
+    def _labels(self, labels):
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        registry.add(self.name, self._labels(labels), [amount])
+
+    def samples(self, labels, values):
+        yield f'{self.name}{_format_labels(labels)} {values[0]}'
+
+
+class Histogram(Counter):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        if buckets[-1] != float('inf'):
+            buckets = (*buckets, float('inf'))
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        # Значения: сумма, затем число попаданий в каждую корзину;
+        # последняя, +Inf, заодно считает все наблюдения.
+        amounts = [value] + [int(value <= bound) for bound in self.buckets]
+        registry.add(self.name, self._labels(labels), amounts)
+
+    def samples(self, labels, values):
+        for bound, count in zip(self.buckets, values[1:]):
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            bucket_labels = _format_labels({**labels, 'le': le})
+            yield f'{self.name}_bucket{bucket_labels} {count}'
+        yield f'{self.name}_sum{_format_labels(labels)} {values[0]}'
+        yield f'{self.name}_count{_format_labels(labels)} {values[-1]}'
+
+
+REQUEST_DURATION = Histogram(
+    'yatube_request_duration_seconds',
+    'Время обработки запроса по имени URL и коду ответа.',
+    ('view', 'status'),
+)
+REQUEST_QUERIES = Counter(
+    'yatube_db_queries_total',
+    'SQL-запросы, выполненные при обработке запросов, по имени URL.',
+    ('view',),
+)
+FEED_CACHE = Counter(
+    'yatube_feed_cache_requests_total',
+    'Обращения к кэшу страниц лент по view: hit или miss.',
+    ('feed', 'result'),
+)
+THUMBNAIL_DURATION = Histogram(
+    'yatube_thumbnail_generation_seconds',
+    'Время создания всех миниатюр одной картинки поста.',
+)
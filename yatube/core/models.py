@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import F
 
 
 class CreatedModel(models.Model):
@@ -12,3 +13,40 @@ class CreatedModel(models.Model):
     class Meta:
         abstract = True
         ordering = ('-pub_date',)
+
+
+class StoredFileManager(models.Manager):
+    def acquire(self, name):
+        """Добавляет ссылку на файл name. Первый же запрос — запись,
+        поэтому транзакция сразу берёт блокировку, которую ждёт release.
+        """
+        self.bulk_create(
+            [self.model(name=name, references=0)], ignore_conflicts=True
+        )
+        self.filter(name=name).update(references=F('references') + 1)
+
+    def release(self, name):
+        """Убирает ссылку на файл name и возвращает, сколько их осталось."""
+        self.filter(name=name, references__gt=0).update(
+            references=F('references') - 1
+        )
+        return self.filter(name=name).values_list(
+            'references', flat=True
+        ).first() or 0
+
+
+class StoredFile(models.Model):
+    """Файл хранилища по хешу и число ссылок на него: одинаковые
+    загрузки делят один файл, и удалять его можно только без ссылок.
+    """
+    name = models.CharField('Имя файла', max_length=255, primary_key=True)
+    references = models.PositiveIntegerField('Ссылок', default=0)
+
+    objects = StoredFileManager()
+
+    class Meta:
+        verbose_name = 'Файл хранилища'
+        verbose_name_plural = 'Файлы хранилища'
+
+    def __str__(self):
+        return self.name
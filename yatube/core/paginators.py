@@ -0,0 +1,115 @@
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу (pub_date, id).
+
+    Страница выбирается условием «строго после/до курсора» вместо
+    OFFSET и COUNT(*), поэтому время выборки не зависит от номера
+    страницы, а ссылки не сдвигаются при добавлении новых записей.
+    Обычный постраничный доступ по номеру (page()) сохранён.
+
+    window(paginator, key, forward, count) — необязательное сужение
+    выборки: условие Q на object_list, под которое заведомо попадают
+    count ближайших записей за ключом key (None — с начала) в
+    направлении forward. Так страница собирается из нескольких
+    источников, каждый из которых читается по своему индексу.
+    """
+
+    def __init__(self, object_list, per_page,
+                 ordering=('-pub_date', '-id'), window=None, **kwargs):
+        self.ordering = ordering
+        self.window = window
+        self.descending = ordering[0].startswith('-')
+        self.fields = tuple(field.lstrip('-') for field in ordering)
+        super().__init__(object_list.order_by(*ordering), per_page, **kwargs)
+
+    def encode_cursor(self, obj):
+        """Курсор объекта или строки values(): значения ключа
+        сортировки в base64.
+        """
+        date_field, pk_field = self.fields
+        if isinstance(obj, dict):
+            date, pk = obj[date_field], obj[pk_field]
+        else:
+            date, pk = getattr(obj, date_field), getattr(obj, pk_field)
+        return urlsafe_base64_encode(force_bytes(f'{date.isoformat()}|{pk}'))
+
+    def decode_cursor(self, cursor):
+        """Возвращает ключ (дата, id) или None для битого курсора."""
+        if not cursor:
+            return None
+        try:
+            value, pk = force_str(urlsafe_base64_decode(cursor)).split('|')
+            date = parse_datetime(value)
+            pk = int(pk)
+        except (ValueError, UnicodeDecodeError):
+            return None
+        if date is None:
+            return None
+        return date, pk
+
+    def newest_first(self, forward):
+        """Идёт ли обход в направлении forward от новых к старым."""
+        return forward == self.descending
+
+    def beyond(self, key, forward, fields=None):
+        """Условие «за курсором» в направлении обхода. fields — поля
+        даты и id, если они называются иначе, чем в ordering.
+
+        Условие по одной дате дублирует основное, чтобы база могла
+        читать индекс по дате диапазоном, а не с самого начала.
+        """
+        date_field, pk_field = fields or self.fields
+        lookup = 'lt' if self.newest_first(forward) else 'gt'
+        date, pk = key
+        return Q(**{f'{date_field}__{lookup}e': date}) & (
+            Q(**{f'{date_field}__{lookup}': date})
+            | Q(**{date_field: date, f'{pk_field}__{lookup}': pk})
+        )
+
+    def get_cursor_page(self, after=None, before=None):
+        """Возвращает страницу после курсора after или перед before.
+
+        Без курсора отдаётся первая страница. У страницы появляются
+        атрибуты next_cursor и previous_cursor (None, если дальше
+        записей нет).
+        """
+        forward = not before
+        cursor = after if forward else before
+        key = self.decode_cursor(cursor)
+        if key is None:
+            forward, cursor = True, None
+        queryset = self.object_list
+        if key is not None:
+            queryset = queryset.filter(self.beyond(key, forward))
+        if self.window is not None:
+            queryset = queryset.filter(
+                self.window(self, key, forward, self.per_page + 1)
+            )
+        if not forward:
+            queryset = queryset.reverse()
+        objects = list(queryset[:self.per_page + 1])
+        has_more = len(objects) > self.per_page
+        if not forward and not has_more:
+            # Дошли до начала ленты — показываем полную первую страницу.
+            return self.get_cursor_page()
+        objects = objects[:self.per_page]
+        if not forward:
+            objects.reverse()
+        has_next = has_more if forward else True
+        has_previous = cursor is not None if forward else True
+        page = Page(objects, 1, self)
+        page.next_cursor = None
+        page.previous_cursor = None
+        if has_next and objects:
+            page.next_cursor = self.encode_cursor(objects[-1])
+        if has_previous:
+            page.previous_cursor = (
+                self.encode_cursor(objects[0]) if objects else cursor
+            )
+        return page
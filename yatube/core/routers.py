@@ -0,0 +1,96 @@
+import random
+import threading
+from django.conf import settings
+
+
+# Кука, которая после записи посетителя на REPLICA_PIN_SECONDS
+# направляет его чтения в основную базу.
+PIN_COOKIE = 'read_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_local = threading.local()
+
+
+def current_replica():
+    """Реплика, из которой читает текущий запрос, или None."""
+    return getattr(_local, 'replica', None)
+
+
+def pin_primary():
+    """Переводит чтения текущего запроса на основную базу, например
+    если нужные данные изменились недавно и реплика может отставать.
+    """
+    _local.replica = None
+
+
+def wrote():
+    """Писал ли текущий запрос в базу."""
+    return getattr(_local, 'wrote', False)
+
+
+class ReplicaRouter:
+    """Отправляет чтения моделей из REPLICA_READ_APPS в запросах только
+    на чтение в реплику, выбранную ReplicaMiddleware. Запись, миграции
+    и чтения вне таких запросов идут в основную базу.
+
+    Запись отмечается в запросе: дальше он читает из основной базы,
+    а ReplicaMiddleware ставит посетителю куку PIN_COOKIE, даже если
+    записал запрос GET.
+    """
+
+    def db_for_read(self, model, **hints):
+        replica = current_replica()
+        if replica and model._meta.app_label in settings.REPLICA_READ_APPS:
+            return replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        _local.wrote = True
+        pin_primary()
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """Выбирает реплику для запросов GET, HEAD и OPTIONS.
+
+    Остальные запросы работают с основной базой. Запрос, который что-то
+    записал, ставит куку PIN_COOKIE: пока она жива, посетитель тоже
+    читает из основной базы и видит свои изменения, даже если реплики
+    от неё отстают.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replicas = settings.DATABASE_REPLICAS
+        if (
+            replicas
+            and request.method in SAFE_METHODS
+            and PIN_COOKIE not in request.COOKIES
+        ):
+            _local.replica = random.choice(replicas)
+        _local.wrote = False
+        try:
+            response = self.get_response(request)
+            pin = wrote()
+        finally:
+            pin_primary()
+            _local.wrote = False
+        if replicas and pin:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
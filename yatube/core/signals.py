@@ -0,0 +1,14 @@
+from django.conf import settings
+from .instrumentation import unbudgeted
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Настраивает каждое новое соединение с SQLite прагмами
+    из SQLITE_PRAGMAS. Соединение открывается раз на поток, поэтому
+    прагмы не входят в бюджет запросов view.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with unbudgeted(), connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,60 @@
+import hashlib
+import os
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import router, transaction
+from django.utils.deconstruct import deconstructible
+from .models import StoredFile
+
+
+@deconstructible
+class HashedFileSystemStorage(FileSystemStorage):
+    """Хранит файлы под SHA-256 их содержимого.
+
+    Одинаковые файлы сохраняются один раз и получают одно имя, поэтому
+    посты с одной картинкой делят и файл, и его миниатюры. Ссылки на
+    файл считаются в StoredFile: save() добавляет ссылку, release()
+    убирает и удаляет файл, когда ссылок не осталось.
+    """
+
+    def get_hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        hexdigest = digest.hexdigest()
+        dirname = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(dirname, hexdigest[:2], hexdigest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_hashed_name(name, content)
+        with transaction.atomic(using=router.db_for_write(StoredFile)):
+            # Ссылка берётся до проверки: пока она есть, release() файл
+            # не удалит, а удалённый раньше файл будет записан заново.
+            StoredFile.objects.acquire(name)
+            if self.exists(name):
+                return name
+            return super().save(name, content, max_length=max_length)
+
+    def release(self, name, in_use=None, delete=None):
+        """Убирает ссылку на файл name. Если ссылок не осталось и
+        in_use(name) ложно, удаляет файл функцией delete(name) (по
+        умолчанию — self.delete). Возвращает True, если файл удалён.
+
+        Проверка и удаление идут под той же блокировкой записи, что
+        и save(), так что одновременная загрузка того же файла либо
+        успевает взять ссылку и файл остаётся, либо записывает его
+        заново после удаления.
+        """
+        with transaction.atomic(using=router.db_for_write(StoredFile)):
+            if StoredFile.objects.release(name):
+                return False
+            if in_use is not None and in_use(name):
+                return False
+            StoredFile.objects.filter(name=name).delete()
+            (delete or self.delete)(name)
+        return True
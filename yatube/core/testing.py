@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from django.db import connections
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+@contextmanager
+def lagging_replica(alias='replica'):
+    """Реплика, которая отстала от основной базы: снимок её текущего
+    состояния в отдельном файле SQLite, подключённый как DATABASE_REPLICAS.
+    Изменения основной базы внутри блока в реплику не попадают.
+
+    Снимок берётся из зафиксированных данных, поэтому нужен
+    TransactionTestCase.
+    """
+    primary = connections['default']
+    primary.ensure_connection()
+    handle, path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(handle)
+    replica = sqlite3.connect(path)
+    try:
+        primary.connection.backup(replica)
+    finally:
+        replica.close()
+    connections.databases[alias] = {
+        **connections.databases['default'], 'NAME': path, 'TEST': {},
+    }
+    try:
+        with override_settings(DATABASE_REPLICAS=[alias]):
+            yield alias
+    finally:
+        connections[alias].close()
+        del connections[alias]
+        del connections.databases[alias]
+        os.remove(path)
+
+
+class TestRunner(DiscoverRunner):
+    """Запуск тестов, в котором превышение QUERY_BUDGETS роняет любой
+    тест, а не только тесты бюджетов.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.enforce_budgets = override_settings(QUERY_BUDGETS_ENFORCE=True)
+        self.enforce_budgets.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.enforce_budgets.disable()
+        super().teardown_test_environment(**kwargs)
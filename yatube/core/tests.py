@@ -0,0 +1,304 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+from http import HTTPStatus
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+from django.db import connection, router
+from django.http import HttpResponse
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+from posts.cache import bump_feed_versions, conditional_feed
+from posts.models import Post
+from yatube.asgi import application as asgi_application
+from .metrics import registry
+from .routers import PIN_COOKIE, ReplicaMiddleware
+
+
+METRICS_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(METRICS_DIR=METRICS_DIR)
+class MetricsTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def get_metrics(self):
+        response = self.guest_client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response.content.decode()
+
+    def test_request_latency_and_feed_cache(self):
+        """/metrics отдаёт гистограмму времени запросов и счётчики
+        кэша лент.
+        """
+        index = reverse('posts:index')
+        self.guest_client.get(index)
+        self.guest_client.get(index)
+        metrics = self.get_metrics()
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{view="posts:index",'
+            'status="200",le="+Inf"}',
+            metrics,
+        )
+        self.assertIn(
+            'yatube_feed_cache_requests_total{feed="index",result="hit"}',
+            metrics,
+        )
+        self.assertIn('yatube_db_queries_total{view="posts:index"}', metrics)
+
+    def test_other_processes_are_summed(self):
+        """Значения других процессов из METRICS_DIR складываются."""
+        path = os.path.join(METRICS_DIR, 'metrics-0.json')
+        with open(path, 'w') as file:
+            json.dump(
+                [['yatube_db_queries_total', [['view', 'other']], [7]]], file
+            )
+        self.assertIn(
+            'yatube_db_queries_total{view="other"} 7', self.get_metrics()
+        )
+        os.remove(path)
+
+    def test_flush_writes_process_file(self):
+        """Процесс сбрасывает свои метрики в METRICS_DIR."""
+        self.guest_client.get(reverse('posts:index'))
+        registry.flush(force=True)
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(METRICS_DIR, f'metrics-{os.getpid()}.json')
+            )
+        )
+
+    def test_metrics_are_not_public(self):
+        """Метрики недоступны с адресов не из METRICS_ALLOWED_IPS."""
+        response = self.guest_client.get(
+            reverse('metrics'), REMOTE_ADDR='10.0.0.1'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+
+
+class BenchmarkCommandTests(TestCase):
+    def setUp(self):
+        call_command(
+            'seed_yatube', users=10, groups=2, posts=30, comments=30,
+            follows=20, images=0, stdout=StringIO(),
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.baseline = os.path.join(directory.name, 'baseline.json')
+
+    def benchmark(self, **options):
+        call_command(
+            'benchmark_views', requests=2, warmup=0, alloc_requests=1,
+            only=['index', 'post_detail', 'add_comment'],
+            stdout=StringIO(), **options,
+        )
+
+    def test_baseline_is_saved_and_compared(self):
+        """benchmark_views сохраняет замер и падает, если view стал
+        делать больше SQL-запросов, чем в baseline.
+        """
+        self.benchmark(save_baseline=self.baseline)
+        with open(self.baseline) as file:
+            results = json.load(file)
+        self.assertEqual(
+            set(results), {'index', 'post_detail', 'add_comment'}
+        )
+        for result in results.values():
+            self.assertIn('p95_ms', result)
+            self.assertIn('alloc_kib', result)
+        self.assertGreater(results['add_comment']['queries'], 0)
+        results['add_comment']['queries'] = 0
+        with open(self.baseline, 'w') as file:
+            json.dump(results, file)
+        with self.assertRaisesMessage(CommandError, 'add_comment'):
+            self.benchmark(baseline=self.baseline, tolerance=100)
+
+    def test_allocations_without_reset_peak(self):
+        """На Python до 3.9 без tracemalloc.reset_peak замер памяти
+        тоже работает.
+        """
+        old_tracemalloc = SimpleNamespace(**{
+            name: getattr(tracemalloc, name)
+            for name in ('start', 'stop', 'clear_traces', 'get_traced_memory')
+        })
+        with mock.patch(
+            'core.management.commands.benchmark_views.tracemalloc',
+            old_tracemalloc,
+        ):
+            self.benchmark(save_baseline=self.baseline)
+        with open(self.baseline) as file:
+            results = json.load(file)
+        for result in results.values():
+            self.assertGreater(result['alloc_kib'], 0)
+
+
+class AsgiApplicationTests(TransactionTestCase):
+    def call(self, scope, body_parts=()):
+        scope = {
+            'type': 'http', 'http_version': '1.1', 'method': 'GET',
+            'path': '/', 'query_string': b'', 'headers': [], **scope,
+        }
+        messages = [
+            {'type': 'http.request', 'body': part, 'more_body': True}
+            for part in body_parts
+        ] + [{'type': 'http.request', 'body': b''}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(asgi_application(scope, receive, send))
+        return sent
+
+    def test_django_page(self):
+        """ASGI-приложение проекта отдаёт страницы Django."""
+        sent = self.call({'path': reverse('about:author')})
+        self.assertEqual(sent[0]['status'], HTTPStatus.OK)
+        body = b''.join(message.get('body', b'') for message in sent[1:])
+        self.assertIn(b'<html', body)
+
+    def test_request_body_in_parts(self):
+        """Тело запроса, пришедшее частями, доходит до Django целиком."""
+        token = 'a' * 64
+        body = f'csrfmiddlewaretoken={token}&username=asgi-user&password=x'
+        body = body.encode()
+        sent = self.call(
+            {
+                'method': 'POST', 'path': reverse('users:login'),
+                'headers': [
+                    (b'content-type', b'application/x-www-form-urlencoded'),
+                    (b'content-length', str(len(body)).encode()),
+                    (b'cookie', f'csrftoken={token}'.encode()),
+                ],
+            },
+            [body[:10], body[10:]],
+        )
+        content = b''.join(message.get('body', b'') for message in sent[1:])
+        self.assertEqual(sent[0]['status'], HTTPStatus.OK)
+        self.assertIn(b'asgi-user', content)
+
+    @override_settings(ASGI_MAX_BODY_BYTES=10)
+    def test_large_body_is_rejected_before_django(self):
+        """Тело длиннее ASGI_MAX_BODY_BYTES отклоняется, не доходя
+        до Django: и по Content-Length, и без него, пока приходит.
+        """
+        path = reverse('posts:post_create')
+        requests = (
+            ([(b'content-length', b'11')], [b'x' * 11]),
+            ([], [b'x' * 6, b'x' * 6]),
+        )
+        for headers, body_parts in requests:
+            with self.subTest(headers=headers), mock.patch(
+                'django.core.handlers.wsgi.WSGIHandler.__call__'
+            ) as django:
+                sent = self.call(
+                    {'method': 'POST', 'path': path, 'headers': headers},
+                    body_parts,
+                )
+                self.assertEqual(
+                    sent[0]['status'], HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+                )
+                django.assert_not_called()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def route(self, request, view=None, write=False):
+        """Базы, куда роутер отправил бы чтение поста и сессии внутри
+        view, а при write — запись поста и чтение после неё.
+        """
+        routes = {}
+
+        def get_response(request):
+            routes['post'] = router.db_for_read(Post)
+            routes['session'] = router.db_for_read(Session)
+            if write:
+                routes['write'] = router.db_for_write(Post)
+                routes['post_after_write'] = router.db_for_read(Post)
+            return HttpResponse()
+
+        if view is not None:
+            get_response = view(get_response)
+        request.user = AnonymousUser()
+        response = ReplicaMiddleware(get_response)(request)
+        return routes, response
+
+    def test_reads_go_to_replica(self):
+        """Чтения постов в GET-запросах идут в реплику, а сессии —
+        в основную базу.
+        """
+        routes, response = self.route(self.factory.get('/'))
+        self.assertEqual(routes, {'post': 'replica', 'session': 'default'})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_reads_after_write_are_pinned(self):
+        """После записи, даже в GET-запросе, посетитель читает
+        из основной базы.
+        """
+        routes, response = self.route(self.factory.get('/'), write=True)
+        self.assertEqual(routes, {
+            'post': 'replica', 'session': 'default',
+            'write': 'default', 'post_after_write': 'default',
+        })
+        self.assertIn(PIN_COOKIE, response.cookies)
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        routes, _ = self.route(request)
+        self.assertEqual(routes['post'], 'default')
+
+    def test_requests_without_writes_are_not_pinned(self):
+        """Запрос POST, который ничего не записал, куку не ставит."""
+        routes, response = self.route(self.factory.post('/'))
+        self.assertEqual(routes['post'], 'default')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_recently_changed_feed_is_read_from_primary(self):
+        """Недавно изменившаяся лента читается из основной базы."""
+        view = conditional_feed('replica-test')
+        routes, _ = self.route(self.factory.get('/'), view)
+        self.assertEqual(routes['post'], 'default')
+        with override_settings(REPLICA_PIN_SECONDS=-1):
+            bump_feed_versions(['replica-test'])
+            routes, _ = self.route(self.factory.get('/'), view)
+        self.assertEqual(routes['post'], 'replica')
+
+
+class SQLitePragmasTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_new_connections_get_pragmas(self):
+        """Соединения с SQLite открываются с прагмами SQLITE_PRAGMAS."""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(
+                cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout']
+            )
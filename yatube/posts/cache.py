@@ -0,0 +1,168 @@
+import hashlib
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.cache import cache_page
+from core.metrics import FEED_CACHE
+from core.routers import pin_primary
+
+
+VERSION_KEY = 'feed-version:{}'
+MODIFIED_KEY = 'feed-modified:{}'
+
+
+def get_feed_versions(scopes):
+    """Возвращает текущие версии лент и время (timestamp) последнего
+    изменения самой свежей из них.
+
+    Отсутствующая версия заводится от текущего времени, чтобы после
+    вытеснения ключа не совпасть со старыми закэшированными страницами.
+    Если вытеснено время изменения, оно неизвестно и вместо него
+    возвращается None.
+    """
+    scopes = list(scopes)
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    modified_keys = [MODIFIED_KEY.format(scope) for scope in scopes]
+    values = cache.get_many(keys + modified_keys)
+    missing = [
+        (key, modified_key)
+        for key, modified_key in zip(keys, modified_keys)
+        if key not in values
+    ]
+    if missing:
+        now = time.time()
+        for key, modified_key in missing:
+            if cache.add(key, int(now * 1000), None):
+                cache.add(modified_key, int(now), None)
+        values.update(cache.get_many(
+            [key for pair in missing for key in pair]
+        ))
+    modified = [values.get(key) for key in modified_keys]
+    last_modified = None if None in modified else max(modified, default=None)
+    return [values[key] for key in keys], last_modified
+
+
+def bump_feed_versions(scopes):
+    """Сбрасывает кэш лент, увеличивая их версии."""
+    scopes = set(scopes)
+    for scope in scopes:
+        try:
+            cache.incr(VERSION_KEY.format(scope))
+        except ValueError:
+            # Версии нет — новая будет заведена при следующем чтении.
+            pass
+    now = int(time.time())
+    cache.set_many(
+        {MODIFIED_KEY.format(scope): now for scope in scopes}, None
+    )
+
+
+def post_feed_scopes(post):
+    """Ленты, в которых показывается пост."""
+    scopes = ['index', f'author:{post.author.username}']
+    if post.group_id:
+        scopes.append(f'group:{post.group.slug}')
+    return scopes
+
+
+def feed_etag(request, versions):
+    """ETag страницы: версии её лент и то, что на странице зависит
+    от посетителя, — пользователь и секрет CSRF-токенов в формах.
+    """
+    key = '|'.join(map(str, (
+        request.get_full_path(),
+        request.user.pk,
+        request.META.get('CSRF_COOKIE', ''),
+        *versions,
+    )))
+    return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+
+def conditional_feed(*scopes, lookup=None):
+    """Отвечает 304 Not Modified, не вызывая view, если у клиента
+    страница с теми же версиями лент scopes (ETag).
+
+    Области форматируются аргументами view, например 'group:{slug}'.
+    lookup(**kwargs) добавляет недостающие аргументы; если он вернул
+    None, view вызывается без проверок.
+    Недавно изменившиеся ленты читаются из основной базы, чтобы
+    в кэш и ETag не попала страница с отстающей реплики.
+    Страницы зависят от посетителя, поэтому помечаются private,
+    а max-age=0 заставляет браузер сверяться с сервером.
+    Last-Modified не отправляется: время изменения хранится
+    с точностью до секунды и общее для всех посетителей, так что
+    по If-Modified-Since клиент получил бы 304 на страницу, изменённую
+    в ту же секунду или для другого пользователя.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            params = kwargs
+            if lookup is not None:
+                extra = lookup(**kwargs)
+                if extra is None:
+                    return view(request, *args, **kwargs)
+                params = {**kwargs, **extra}
+            versions, last_modified = get_feed_versions(
+                scope.format(**params) for scope in scopes
+            )
+            if (
+                last_modified is None
+                or time.time() - last_modified < settings.REPLICA_PIN_SECONDS
+            ):
+                # Реплика могла ещё не получить изменения ленты.
+                pin_primary()
+            etag = feed_etag(request, versions)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                request.feed_versions = versions
+                response = view(request, *args, **kwargs)
+                # Форма могла завести посетителю новый секрет CSRF.
+                etag = feed_etag(request, versions)
+            if response.status_code not in (200, 304):
+                return response
+            response['ETag'] = etag
+            del response['Last-Modified']
+            del response['Expires']
+            patch_cache_control(response, private=True, max_age=0)
+            return response
+        return wrapper
+    return decorator
+
+
+def cache_feed(*scopes):
+    """Кэширует страницу ленты на CACHES_LIMIT секунд или до смены
+    версии любой из лент scopes и отвечает на условные запросы
+    (см. conditional_feed). view может быть и вызываемым объектом,
+    например лентой RSS.
+    """
+    def decorator(view):
+        @conditional_feed(*scopes)
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            versions = getattr(request, 'feed_versions', None)
+            if versions is None:
+                return view(request, *args, **kwargs)
+            key_prefix = 'feed.' + '.'.join(map(str, versions))
+            rendered = []
+
+            def render(*args, **kwargs):
+                rendered.append(True)
+                return view(*args, **kwargs)
+
+            cached_view = cache_page(
+                settings.CACHES_LIMIT, key_prefix=key_prefix
+            )(render)
+            response = cached_view(request, *args, **kwargs)
+            FEED_CACHE.inc(
+                feed=getattr(view, '__name__', type(view).__name__),
+                result='miss' if rendered else 'hit',
+            )
+            return response
+        return wrapper
+    return decorator
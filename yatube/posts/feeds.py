@@ -0,0 +1,109 @@
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+from .cache import cache_feed
+from .models import Group, Post, User
+
+
+class LatestPostsFeed(Feed):
+    """RSS последних постов сайта."""
+
+    title = 'Yatube: последние записи'
+    description = 'Последние обновления на сайте'
+
+    def link(self):
+        return reverse('posts:index')
+
+    def items(self):
+        return Post.objects.select_related('author', 'group')[
+            :settings.FEED_ITEMS
+        ]
+
+    def item_title(self, item):
+        return Truncator(item.text).chars(50)
+
+    def item_description(self, item):
+        return item.text
+
+    def item_link(self, item):
+        return reverse('posts:post_detail', kwargs={'post_id': item.pk})
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_updateddate(self, item):
+        return item.edited
+
+    def item_categories(self, item):
+        return [item.group.title] if item.group_id else []
+
+
+class GroupPostsFeed(LatestPostsFeed):
+    """RSS последних постов группы."""
+
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def title(self, obj):
+        return f'Yatube: записи сообщества {obj.title}'
+
+    def description(self, obj):
+        return obj.description or ''
+
+    def link(self, obj):
+        return reverse('posts:group_list', kwargs={'slug': obj.slug})
+
+    def items(self, obj):
+        return obj.posts.select_related('author', 'group')[
+            :settings.FEED_ITEMS
+        ]
+
+
+class AuthorPostsFeed(LatestPostsFeed):
+    """RSS последних постов автора."""
+
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, obj):
+        return f'Yatube: записи {obj.get_full_name() or obj.username}'
+
+    def description(self, obj):
+        return f'Все посты пользователя {obj.username}'
+
+    def link(self, obj):
+        return reverse('posts:profile', kwargs={'username': obj.username})
+
+    def items(self, obj):
+        return Post.objects.select_related('author', 'group').filter(
+            author=obj
+        )[:settings.FEED_ITEMS]
+
+
+class LatestPostsAtomFeed(LatestPostsFeed):
+    feed_type = Atom1Feed
+
+
+class GroupPostsAtomFeed(GroupPostsFeed):
+    feed_type = Atom1Feed
+
+
+class AuthorPostsAtomFeed(AuthorPostsFeed):
+    feed_type = Atom1Feed
+
+
+# Готовые документы лент кэшируются и отдаются с ETag
+# так же, как HTML-страницы лент: новый или изменённый пост меняет
+# версию ленты (см. posts.cache).
+index_rss = cache_feed('index')(LatestPostsFeed())
+index_atom = cache_feed('index')(LatestPostsAtomFeed())
+group_rss = cache_feed('group:{slug}')(GroupPostsFeed())
+group_atom = cache_feed('group:{slug}')(GroupPostsAtomFeed())
+author_rss = cache_feed('author:{username}')(AuthorPostsFeed())
+author_atom = cache_feed('author:{username}')(AuthorPostsAtomFeed())
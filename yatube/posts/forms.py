@@ -1,5 +1,6 @@
 from django import forms
 from .models import Post, Comment
+from .uploads import downscale_image, image_too_large
 
 
 class PostForm(forms.ModelForm):
@@ -7,6 +8,28 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Файл, отброшенный BoundedUploadHandler, не доходит до поля,
+        # а его ошибка показывается при проверке формы.
+        self.upload_error = getattr(
+            self.files.get('image'), 'upload_error', None
+        )
+        if self.upload_error:
+            self.files = self.files.copy()
+            del self.files['image']
+
+    def clean_image(self):
+        if self.upload_error:
+            raise forms.ValidationError(self.upload_error, code='too_large')
+        image = self.cleaned_data.get('image')
+        if not image or 'image' not in self.changed_data:
+            return image
+        error = image_too_large(image.image.size)
+        if error:
+            raise forms.ValidationError(error, code='too_large')
+        return downscale_image(image)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
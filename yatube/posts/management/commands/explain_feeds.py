@@ -0,0 +1,60 @@
+import statistics
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from posts.models import AuthorStats, Comment, Follow, Group, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Печатает планы и медианное время запросов лент на текущей базе. '
+        'Для сравнения до и после индексов запустите команду на одной '
+        'и той же заполненной базе после `migrate posts 0017` '
+        'и после `migrate posts`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз выполнять каждый запрос.',
+        )
+
+    def get_queries(self):
+        """Запросы в той же форме, что выполняют view лент."""
+        busiest = AuthorStats.objects.order_by('-posts_count').first()
+        reader = AuthorStats.objects.order_by('-following_count').first()
+        post = Post.objects.order_by('-comments_count').first()
+        group = Group.objects.first()
+        if None in (busiest, reader, post, group):
+            raise CommandError(
+                'В базе нет постов, групп или авторов: заполните её '
+                'перед замером.'
+            )
+        limit = settings.PAGES_LIMIT + 1
+        ordering = ('-pub_date', '-id')
+        return {
+            'index': Post.objects.order_by(*ordering)[:limit],
+            'profile': Post.objects.filter(
+                author_id=busiest.user_id
+            ).order_by(*ordering)[:limit],
+            'group_posts': Post.objects.filter(
+                group=group
+            ).order_by(*ordering)[:limit],
+            'post_detail comments': Comment.objects.filter(post=post),
+            'profile following': Follow.objects.filter(
+                user_id=reader.user_id, author_id=busiest.user_id
+            ),
+        }
+
+    def handle(self, *args, **options):
+        for name, queryset in self.get_queries().items():
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain())
+            self.stdout.write(
+                f'медиана: {statistics.median(timings):.2f} мс\n'
+            )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Создаёт миниатюры для всех картинок постов, которых ещё нет.'
+
+    def handle(self, *args, **options):
+        images = Post.objects.exclude(image='').order_by().values_list(
+            'image', flat=True
+        ).distinct()
+        done = failed = 0
+        for name in images.iterator():
+            try:
+                generate_thumbnails(name)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+            else:
+                done += 1
+        self.stdout.write(
+            f'Обработано картинок: {done}, с ошибками: {failed}'
+        )
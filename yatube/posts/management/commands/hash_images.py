@@ -0,0 +1,38 @@
+import os
+from django.core.management.base import BaseCommand
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов, загруженные до хранилища по хешу, '
+        'под имена по содержимому. Одинаковые картинки объединяются, '
+        'старые файлы и их миниатюры удаляются.'
+    )
+
+    def handle(self, *args, **options):
+        field = Post._meta.get_field('image')
+        images = Post.objects.exclude(image='').order_by().values_list(
+            'image', flat=True
+        ).distinct()
+        moved = failed = 0
+        for name in list(images):
+            try:
+                with field.storage.open(name) as content:
+                    new_name = field.storage.save(
+                        field.generate_filename(None, os.path.basename(name)),
+                        content,
+                    )
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+                continue
+            if new_name == name:
+                continue
+            for post in Post.objects.filter(image=name):
+                post.image.name = new_name
+                post.save(update_fields=('image', 'edited'))
+            moved += 1
+        self.stdout.write(
+            f'Перенесено картинок: {moved}, с ошибками: {failed}'
+        )
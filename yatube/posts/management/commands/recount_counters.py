@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from posts.models import AuthorStats, Comment, Follow, Post, User
+
+
+def count_of(model, field):
+    """Подзапрос с числом строк model, ссылающихся на внешний объект."""
+    counts = model.objects.filter(**{field: OuterRef('pk')}).order_by(
+    ).values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def fix_counter(queryset, counter, actual):
+    """Одним UPDATE исправляет разошедшиеся значения счётчика."""
+    drifted = queryset.annotate(actual=actual).exclude(
+        **{counter: F('actual')}
+    ).values('pk')
+    return queryset.filter(pk__in=drifted).update(**{counter: actual})
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счётчики комментариев постов '
+        'и статистику авторов.'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixed = fix_counter(
+                Post.objects.all(),
+                'comments_count',
+                count_of(Comment, 'post'),
+            )
+            missing = User.objects.filter(stats__isnull=True).values_list(
+                'pk', flat=True
+            )
+            AuthorStats.objects.bulk_create(
+                [AuthorStats(user_id=pk) for pk in missing.iterator()],
+            )
+            stats = AuthorStats.objects.all()
+            fixed += fix_counter(
+                stats, 'posts_count', count_of(Post, 'author')
+            )
+            fixed += fix_counter(
+                stats, 'comments_count', count_of(Comment, 'author')
+            )
+            fixed += fix_counter(
+                stats, 'followers_count', count_of(Follow, 'author')
+            )
+            fixed += fix_counter(
+                stats, 'following_count', count_of(Follow, 'user')
+            )
+        self.stdout.write(f'Исправлено счётчиков: {fixed}')
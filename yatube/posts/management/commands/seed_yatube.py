@@ -0,0 +1,284 @@
+import io
+import random
+import time
+from datetime import timedelta
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from faker import Faker
+from PIL import Image, ImageDraw
+from posts.models import Comment, Follow, Group, Post, TimelineEntry, User
+from posts.search import drop_search_index, install_search_index
+
+
+# Сколько готовых фраз и имён генерирует Faker: тексты собираются
+# из них, иначе на десятках миллионов строк всё время уходит на Faker.
+SENTENCES = 5000
+NAMES = 2000
+
+
+def skewed(rng, size, exponent):
+    """Случайный индекс из range(size) со степенным перекосом к нулю:
+    немногие первые авторы, группы и посты получают большую часть
+    постов, подписчиков и комментариев.
+    """
+    return int(size * rng.random() ** exponent)
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет пустую базу воспроизводимым набором данных для '
+        'нагрузочных замеров: пользователи, группы, посты с картинками '
+        'и без, комментарии и подписки со степенными распределениями. '
+        'При одном --seed данные всегда одинаковые. После вставки '
+        'пересчитывает счётчики, ленты подписок и поисковый индекс; '
+        'миниатюры создаёт generate_thumbnails.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument(
+            '--images', type=int, default=30,
+            help='Сколько разных картинок сгенерировать для постов.',
+        )
+        parser.add_argument(
+            '--image-share', type=float, default=0.2,
+            help='Доля постов с картинкой.',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределить посты.',
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Сколько строк вставлять одним executemany.',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(options['seed'])
+        self.now = timezone.now().replace(microsecond=0)
+        self.connection = connections[router.db_for_write(Post)]
+        self.adapt_date = self.connection.ops.adapt_datetimefield_value
+        # Поисковый индекс дешевле перестроить целиком, чем обновлять
+        # триггерами на каждую вставленную строку.
+        drop_search_index(self.connection)
+        try:
+            users = self.step('пользователи', self.create_users)
+            groups = self.step('группы', self.create_groups)
+            images = self.step('картинки', self.create_images)
+            posts = self.step(
+                'посты', self.create_posts, users, groups, images
+            )
+            self.step('комментарии', self.create_comments, users, posts)
+            self.step('подписки', self.create_follows, users)
+        finally:
+            self.step(
+                'поисковый индекс', install_search_index, self.connection
+            )
+        self.step(
+            'счётчики', call_command, 'recount_counters', stdout=self.stdout
+        )
+        self.step('ленты подписок', TimelineEntry.objects.rebuild)
+        cache.clear()
+
+    def step(self, title, function, *args, **kwargs):
+        started = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.stdout.write(f'{title}: {time.perf_counter() - started:.1f} с')
+        return result
+
+    def insert(self, model, fields, rows, ignore_conflicts=False):
+        """Вставляет строки пачками через executemany и возвращает
+        диапазон их pk (кроме вставки с ignore_conflicts, где pk идут
+        с пропусками).
+
+        bulk_create на SQLite вставляет не больше 999 параметров
+        за запрос и готовит каждое значение через поле модели — на
+        десятках миллионов строк это в разы медленнее.
+        """
+        ops = self.connection.ops
+        columns = ', '.join(
+            ops.quote_name(model._meta.get_field(field).column)
+            for field in fields
+        )
+        placeholders = ', '.join(['%s'] * len(fields))
+        sql = (
+            f'{ops.insert_statement(ignore_conflicts=ignore_conflicts)} '
+            f'{ops.quote_name(model._meta.db_table)} ({columns}) '
+            f'VALUES ({placeholders}) '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts)}'
+        )
+        before = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        rows = iter(rows)
+        try:
+            with transaction.atomic(using=self.connection.alias):
+                with self.connection.cursor() as cursor:
+                    batch = list(islice(rows, self.options['batch_size']))
+                    while batch:
+                        cursor.executemany(sql, batch)
+                        batch = list(
+                            islice(rows, self.options['batch_size'])
+                        )
+        except IntegrityError as error:
+            raise CommandError(
+                f'{model.__name__}: {error}. Заполняйте пустую базу.'
+            )
+        if ignore_conflicts:
+            return None
+        new = model.objects.filter(pk__gt=before).aggregate(
+            first=Min('pk'), last=Max('pk'), total=Count('pk')
+        )
+        if not new['total']:
+            return range(0)
+        if new['last'] - new['first'] + 1 != new['total']:
+            raise CommandError(f'{model.__name__}: pk идут не подряд.')
+        return range(new['first'], new['last'] + 1)
+
+    def create_users(self):
+        names = [self.faker.first_name() for _ in range(NAMES)]
+        surnames = [self.faker.last_name() for _ in range(NAMES)]
+        # Хеш пароля намеренно медленный — считаем один на всех.
+        password = make_password('password')
+        joined = self.adapt_date(self.now)
+        return self.insert(
+            User,
+            (
+                'username', 'first_name', 'last_name', 'email', 'password',
+                'is_superuser', 'is_staff', 'is_active', 'date_joined',
+            ),
+            (
+                (
+                    f'user{number}', self.rng.choice(names),
+                    self.rng.choice(surnames), f'user{number}@example.com',
+                    password, False, False, True, joined,
+                )
+                for number in range(self.options['users'])
+            ),
+        )
+
+    def create_groups(self):
+        created = self.adapt_date(self.now)
+        return self.insert(
+            Group,
+            ('title', 'slug', 'description', 'edited'),
+            (
+                (
+                    self.faker.catch_phrase()[:200],
+                    f'group-{number}',
+                    self.faker.paragraph(),
+                    created,
+                )
+                for number in range(self.options['groups'])
+            ),
+        )
+
+    def create_images(self):
+        field = Post._meta.get_field('image')
+        names = []
+        for number in range(self.options['images']):
+            image = Image.new('RGB', (1280, 720), self.random_color())
+            draw = ImageDraw.Draw(image)
+            for _ in range(12):
+                x, y = self.rng.randrange(1280), self.rng.randrange(720)
+                radius = self.rng.randrange(40, 240)
+                draw.ellipse(
+                    (x - radius, y - radius, x + radius, y + radius),
+                    fill=self.random_color(),
+                )
+            content = io.BytesIO()
+            image.save(content, 'JPEG', quality=85)
+            names.append(field.storage.save(
+                field.generate_filename(None, f'seed-{number}.jpg'),
+                ContentFile(content.getvalue()),
+            ))
+        return names
+
+    def random_color(self):
+        return tuple(self.rng.randrange(256) for _ in range(3))
+
+    def texts(self):
+        sentences = [self.faker.sentence() for _ in range(SENTENCES)]
+        while True:
+            yield ' '.join(
+                self.rng.choices(sentences, k=self.rng.randint(1, 6))
+            )
+
+    def post_date(self, index):
+        """Дата поста номер index: даты растут вместе с pk,
+        как у настоящих постов.
+        """
+        days = timedelta(days=self.options['days'])
+        return self.now - days + days * index / max(self.options['posts'], 1)
+
+    def create_posts(self, users, groups, images):
+        image_share = self.options['image_share']
+        texts = self.texts()
+
+        def posts():
+            for index in range(self.options['posts']):
+                pub_date = self.adapt_date(self.post_date(index))
+                group = None
+                if groups and self.rng.random() < 0.7:
+                    group = groups[skewed(self.rng, len(groups), 2)]
+                image = ''
+                if images and self.rng.random() < image_share:
+                    image = self.rng.choice(images)
+                yield (
+                    next(texts), users[skewed(self.rng, len(users), 3)],
+                    group, image, pub_date, pub_date, 0,
+                )
+
+        return self.insert(
+            Post,
+            (
+                'text', 'author', 'group', 'image', 'pub_date', 'edited',
+                'comments_count',
+            ),
+            posts(),
+        )
+
+    def create_comments(self, users, posts):
+        texts = self.texts()
+
+        def comments():
+            for _ in range(self.options['comments']):
+                # Больше всего комментариев у свежих постов.
+                index = len(posts) - 1 - skewed(self.rng, len(posts), 2)
+                posted = self.post_date(index)
+                pub_date = posted + (self.now - posted) * self.rng.random()
+                yield (
+                    posts[index], self.rng.choice(users), next(texts),
+                    self.adapt_date(pub_date),
+                )
+
+        if posts:
+            self.insert(
+                Comment, ('post', 'author', 'text', 'pub_date'), comments()
+            )
+
+    def create_follows(self, users):
+        def follows():
+            for _ in range(self.options['follows']):
+                user = self.rng.choice(users)
+                author = users[skewed(self.rng, len(users), 3)]
+                if user != author:
+                    yield user, author
+
+        if len(users) > 1:
+            self.insert(
+                Follow, ('user', 'author'), follows(), ignore_conflicts=True
+            )
@@ -0,0 +1,37 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.models import KVStore
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает записи о картинках постов и их миниатюрах из таблицы '
+        'sorl-thumbnail в кэш THUMBNAIL_CACHE, чтобы рендер лент '
+        'не обращался за ними к базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько записей класть в кэш за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        cache = caches[thumbnail_settings.THUMBNAIL_CACHE]
+        rows = KVStore.objects.filter(
+            key__startswith=thumbnail_settings.THUMBNAIL_KEY_PREFIX
+        ).values_list('key', 'value')
+        batch, total = {}, 0
+        for key, value in rows.iterator():
+            batch[key] = value
+            if len(batch) >= options['batch_size']:
+                cache.set_many(
+                    batch, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT
+                )
+                total += len(batch)
+                batch = {}
+        if batch:
+            cache.set_many(batch, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+            total += len(batch)
+        self.stdout.write(f'Загружено записей в кэш миниатюр: {total}')
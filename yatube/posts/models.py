@@ -1,6 +1,11 @@
-from django.db import models
+from django.conf import settings
+from django.db import (IntegrityError, connections, models, router,
+                       transaction)
+from django.db.models import Exists, F, OuterRef, Q, Subquery
 from django.contrib.auth import get_user_model
+from core.instrumentation import unbudgeted
 from core.models import CreatedModel
+from core.storage import HashedFileSystemStorage
 
 
 User = get_user_model()
@@ -29,12 +34,32 @@ class Post(CreatedModel):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=HashedFileSystemStorage(),
         blank=True
     )
+    edited = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+    )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False,
+    )
 
     class Meta(CreatedModel.Meta):
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='post_author_date_idx',
+            ),
+            models.Index(
+                fields=('group', '-pub_date', '-id'),
+                name='post_group_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -44,6 +69,10 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField(blank=True, null=True)
+    edited = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+    )
 
     def __str__(self):
         return self.title
@@ -71,6 +100,42 @@ class Comment(CreatedModel):
         ordering = ('pub_date',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=('post', 'pub_date'), name='comment_post_date_idx'
+            ),
+        ]
+
+
+class FollowManager(models.Manager):
+    def follow(self, user, author):
+        """Подписывает user на author одним INSERT.
+        Повторная подписка упирается в уникальность и ничего не меняет.
+        Возвращает True, если подписка создана.
+        """
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(user=user, author=author)
+        except IntegrityError:
+            return False
+        return True
+
+    def unfollow(self, user, author):
+        """Удаляет подписку: один SELECT строки под блокировкой и один
+        DELETE через Model.delete(), чтобы сработали обработчики
+        post_delete. В подписку подставляются уже известные user
+        и author, и обработчики не перечитывают их из базы.
+        Возвращает True, если подписка была.
+        """
+        with transaction.atomic(using=self.db):
+            follow = self.select_for_update().filter(
+                user=user, author=author
+            ).first()
+            if follow is None:
+                return False
+            follow.user, follow.author = user, author
+            follow.delete()
+        return True
 
 
 class Follow(models.Model):
@@ -87,6 +152,266 @@ class Follow(models.Model):
         related_name='following',
     )
 
+    objects = FollowManager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'author'), name='unique_follow'
+            ),
+        ]
+
+
+class AuthorStatsManager(models.Manager):
+    def recount(self, author_id):
+        """Пересчитывает статистику автора по исходным таблицам.
+        Считает в той базе, куда пишет, а не в реплике: отстающие
+        счётчики сохранились бы в основную базу. Пересчёт разовый,
+        поэтому его запросы не входят в бюджет view.
+        """
+        using = router.db_for_write(self.model)
+        with unbudgeted():
+            stats, _ = self.using(using).update_or_create(
+                user_id=author_id,
+                defaults={
+                    'posts_count': Post.objects.using(using).filter(
+                        author_id=author_id
+                    ).count(),
+                    'comments_count': Comment.objects.using(using).filter(
+                        author_id=author_id
+                    ).count(),
+                    'followers_count': Follow.objects.using(using).filter(
+                        author_id=author_id
+                    ).count(),
+                    'following_count': Follow.objects.using(using).filter(
+                        user_id=author_id
+                    ).count(),
+                },
+            )
+        return stats
+
+    def for_author(self, author):
+        """Возвращает статистику автора.
+        Запрос не выполняется, если автор загружен с select_related('stats').
+        """
+        try:
+            return author.stats
+        except self.model.DoesNotExist:
+            return self.recount(author.pk)
+
+
+class AuthorStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор',
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    comments_count = models.PositiveIntegerField('Комментариев', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    objects = AuthorStatsManager()
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+    def __str__(self):
+        return str(self.user)
+
+
+class TimelineEntryManager(models.Manager):
+    def is_fanned_out(self, author_id):
+        """Посты автора раскладываются по лентам, пока у него
+        меньше TIMELINE_FANOUT_LIMIT подписчиков.
+        """
+        return not AuthorStats.objects.filter(
+            user_id=author_id,
+            followers_count__gte=settings.TIMELINE_FANOUT_LIMIT,
+        ).exists()
+
+    def fan_out(self, post):
+        """Добавляет новый пост в ленты подписчиков автора."""
+        if not self.is_fanned_out(post.author_id):
+            return
+        followers = Follow.objects.filter(
+            author_id=post.author_id
+        ).values_list('user_id', flat=True)
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, post=post, pub_date=post.pub_date)
+                for user_id in followers.iterator()
+            ],
+            ignore_conflicts=True,
+        )
+        self.trim(followers)
+
+    def backfill(self, user_id, author_id):
+        """Добавляет в ленту читателя последние посты нового автора."""
+        if not self.is_fanned_out(author_id):
+            return
+        posts = Post.objects.filter(author_id=author_id).values_list(
+            'pk', 'pub_date'
+        )[:settings.TIMELINE_LENGTH]
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, post_id=pk, pub_date=pub_date)
+                for pk, pub_date in posts
+            ],
+            ignore_conflicts=True,
+        )
+        self.trim([user_id])
+
+    def remove(self, user_id, author_id):
+        """Убирает из ленты читателя посты автора после отписки."""
+        self.filter(user_id=user_id, post__author_id=author_id).delete()
+
+    def trim(self, user_ids):
+        """Оставляет в лентах не больше TIMELINE_LENGTH последних постов."""
+        length = settings.TIMELINE_LENGTH
+        cutoff = self.filter(user=OuterRef('user')).order_by(
+            '-pub_date'
+        ).values('pub_date')[length - 1:length]
+        stale = self.filter(user__in=user_ids).annotate(
+            cutoff=Subquery(cutoff)
+        ).filter(pub_date__lt=F('cutoff'))
+        self.filter(pk__in=stale.values('pk')).delete()
+
+    def rebuild(self):
+        """Заново раскладывает по лентам последние TIMELINE_LENGTH постов
+        авторов, на которых подписан каждый читатель. Нужна после
+        массовой вставки в обход сигналов.
+        """
+        # Сначала у каждого автора берутся TIMELINE_LENGTH последних
+        # постов, затем у каждого читателя — TIMELINE_LENGTH последних
+        # из постов его авторов.
+        table = self.model._meta.db_table
+        sql = f"""
+            INSERT INTO {table} (user_id, post_id, pub_date)
+            SELECT user_id, post_id, pub_date FROM (
+                SELECT follow.user_id, post.post_id, post.pub_date,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY follow.user_id
+                        ORDER BY post.pub_date DESC, post.post_id DESC
+                    ) AS position
+                FROM {Follow._meta.db_table} AS follow
+                JOIN (
+                    SELECT author_id, id AS post_id, pub_date,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY author_id
+                            ORDER BY pub_date DESC, id DESC
+                        ) AS position
+                    FROM {Post._meta.db_table}
+                ) AS post
+                    ON post.author_id = follow.author_id
+                    AND post.position <= %s
+                LEFT JOIN {AuthorStats._meta.db_table} AS stats
+                    ON stats.user_id = follow.author_id
+                WHERE COALESCE(stats.followers_count, 0) < %s
+            ) AS ranked
+            WHERE position <= %s
+        """
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            with connections[self.db].cursor() as cursor:
+                length = settings.TIMELINE_LENGTH
+                cursor.execute(
+                    sql, [length, settings.TIMELINE_FANOUT_LIMIT, length]
+                )
+
+    def merged_authors(self, user):
+        """Авторы читателя, чьи посты подмешиваются в ленту при чтении."""
+        return Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gte=(
+                settings.TIMELINE_FANOUT_LIMIT
+            ),
+        ).values_list('author', flat=True)
+
+    def posts_for(self, user):
+        """Посты ленты подписок: материализованная лента читателя
+        и посты авторов, которые подмешиваются при чтении.
+
+        Страницы ленты читаются с сужением window_for. Принадлежность
+        к материализованной ленте проверяется через EXISTS, а не IN:
+        по IN SQLite выбирал бы и сортировал всю ленту вместо
+        нескольких строк окна.
+        """
+        return Post.objects.annotate(in_timeline=Exists(
+            self.filter(user=user, post=OuterRef('pk'))
+        )).filter(
+            Q(in_timeline=True) | Q(author__in=self.merged_authors(user))
+        )
+
+    def window_for(self, user):
+        """Сужение страницы ленты posts_for для CursorPaginator.
+
+        Страница собирается слиянием ближайших за курсором записей
+        материализованной ленты (по индексу читателя и даты) и
+        стольких же постов каждого подмешиваемого автора (по индексу
+        автора и даты), а не сортировкой всех постов ленты.
+        """
+        authors = list(self.merged_authors(user))
+
+        def window(paginator, key, forward, count):
+            if paginator.newest_first(forward):
+                ordering = ('-pub_date', '-{}')
+            else:
+                ordering = ('pub_date', '{}')
+
+            def nearest(queryset, pk_field):
+                if key is not None:
+                    queryset = queryset.filter(paginator.beyond(
+                        key, forward, fields=('pub_date', pk_field)
+                    ))
+                return queryset.order_by(
+                    *(field.format(pk_field) for field in ordering)
+                ).values(pk_field)[:count]
+
+            condition = Q(pk__in=nearest(self.filter(user=user), 'post_id'))
+            for author_id in authors:
+                condition |= Q(pk__in=nearest(
+                    Post.objects.filter(author_id=author_id), 'id'
+                ))
+            return condition
+
+        return window
+
+
+class TimelineEntry(models.Model):
+    """Пост в материализованной ленте подписок читателя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField('Дата публикации поста')
+
+    objects = TimelineEntryManager()
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'), name='unique_timeline_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date'), name='timeline_user_date_idx'
+            ),
+        ]
@@ -0,0 +1,144 @@
+import re
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import Post
+
+
+# Внешние FTS5-индексы над текстами постов и комментариев. Триггеры
+# держат их в актуальном состоянии при любых записях, включая
+# bulk_create и update(). Пересоздание таблицы миграцией на SQLite
+# удаляет её триггеры, поэтому они восстанавливаются после каждой
+# миграции (см. PostsConfig.ready).
+SEARCH_TABLES = (
+    ('posts_post', 'posts_post_fts'),
+    ('posts_comment', 'posts_comment_fts'),
+)
+
+CREATE_INDEX_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+    "text, content='{table}', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+
+CREATE_TRIGGERS_SQL = (
+    """
+    CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {fts}({fts}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF text ON {table}
+    BEGIN
+        INSERT INTO {fts}({fts}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+)
+
+SEARCH_SQL = """
+    SELECT post_id FROM (
+        SELECT rowid AS post_id, bm25(posts_post_fts) AS rank
+        FROM posts_post_fts
+        WHERE posts_post_fts MATCH %s
+        UNION ALL
+        SELECT comment.post_id, bm25(posts_comment_fts) * 0.5
+        FROM posts_comment_fts
+        JOIN posts_comment AS comment ON comment.id = posts_comment_fts.rowid
+        WHERE posts_comment_fts MATCH %s
+    )
+    GROUP BY post_id
+    ORDER BY MIN(rank), post_id DESC
+    LIMIT %s OFFSET %s
+"""
+
+MAX_SEARCH_WORDS = 10
+
+
+def is_supported(connection):
+    return connection.vendor == 'sqlite'
+
+
+def _create_triggers(cursor, table, fts):
+    for sql in CREATE_TRIGGERS_SQL:
+        cursor.execute(sql.format(table=table, fts=fts))
+
+
+def install_search_index(connection):
+    """Создаёт FTS5-таблицы с триггерами и наполняет их."""
+    if not is_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        for table, fts in SEARCH_TABLES:
+            cursor.execute(CREATE_INDEX_SQL.format(table=table, fts=fts))
+            _create_triggers(cursor, table, fts)
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def restore_search_triggers(connection):
+    """Восстанавливает триггеры существующих FTS5-таблиц."""
+    if not is_supported(connection):
+        return
+    tables = connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        for table, fts in SEARCH_TABLES:
+            if fts in tables:
+                _create_triggers(cursor, table, fts)
+
+
+def drop_search_index(connection):
+    if not is_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        for table, fts in SEARCH_TABLES:
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+            cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+
+def build_match(query):
+    """Превращает ввод пользователя в безопасный запрос FTS5:
+    каждое слово ищется по префиксу, все слова обязательны.
+    """
+    words = re.findall(r'\w+', query)[:MAX_SEARCH_WORDS]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_posts(query, offset, limit):
+    """Возвращает посты, найденные по тексту поста или комментариев,
+    в порядке релевантности.
+    """
+    match = build_match(query)
+    if not match:
+        return []
+    posts = Post.objects.select_related('author', 'group')
+    connection = connections[router.db_for_read(Post)]
+    if not is_supported(connection):
+        return list(posts.filter(
+            Q(text__icontains=query) | Q(comments__text__icontains=query)
+        ).distinct()[offset:offset + limit])
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_SQL, [match, match, limit, offset])
+        ids = [row[0] for row in cursor.fetchall()]
+    found = posts.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
+
+
+def filter_posts(queryset, query):
+    """Оставляет в queryset посты, текст которых находится по query."""
+    match = build_match(query)
+    if not match:
+        return queryset.none()
+    if not is_supported(connections[queryset.db]):
+        return queryset.filter(text__icontains=query)
+    return queryset.filter(pk__in=RawSQL(
+        'SELECT rowid FROM posts_post_fts WHERE posts_post_fts MATCH %s',
+        [match],
+    ))
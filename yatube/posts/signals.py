@@ -0,0 +1,207 @@
+from django.db import connections
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from .cache import bump_feed_versions, post_feed_scopes
+from .models import AuthorStats, Comment, Follow, Group, Post, TimelineEntry
+from .search import restore_search_triggers
+from .thumbnails import release_image
+
+
+def change_author_stats(user_id, counter, delta):
+    """Сдвигает счётчик статистики автора на delta.
+
+    Если записи статистики ещё нет, при увеличении она создаётся
+    пересчётом; при уменьшении отсутствующая запись не трогается,
+    её пересчитает первое чтение.
+    """
+    queryset = AuthorStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{counter}__gt': 0})
+    updated = queryset.update(**{counter: F(counter) + delta})
+    if not updated and delta > 0:
+        AuthorStats.objects.recount(user_id)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comments_count(sender, instance, created, raw, **kwargs):
+    """Увеличивает счётчик комментариев поста при создании комментария."""
+    if created and not raw:
+        Post.objects.filter(pk=instance.post_id).update(
+            comments_count=F('comments_count') + 1
+        )
+        change_author_stats(instance.author_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comments_count(sender, instance, **kwargs):
+    """Уменьшает счётчик комментариев поста при удалении комментария."""
+    Post.objects.filter(pk=instance.post_id, comments_count__gt=0).update(
+        comments_count=F('comments_count') - 1
+    )
+    change_author_stats(instance.author_id, 'comments_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def increment_posts_count(sender, instance, created, raw, **kwargs):
+    """Увеличивает счётчик постов автора."""
+    if created and not raw:
+        change_author_stats(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def decrement_posts_count(sender, instance, **kwargs):
+    """Уменьшает счётчик постов автора."""
+    change_author_stats(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def increment_follow_counts(sender, instance, created, raw, **kwargs):
+    """Обновляет счётчики подписчиков автора и подписок читателя."""
+    if created and not raw:
+        change_author_stats(instance.author_id, 'followers_count', 1)
+        change_author_stats(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def decrement_follow_counts(sender, instance, **kwargs):
+    """Обновляет счётчики при отписке."""
+    change_author_stats(instance.author_id, 'followers_count', -1)
+    change_author_stats(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw, **kwargs):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if created and not raw:
+        TimelineEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw, **kwargs):
+    """Добавляет посты автора в ленту нового подписчика."""
+    if created and not raw:
+        TimelineEntry.objects.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clean_timeline(sender, instance, **kwargs):
+    """Убирает посты автора из ленты бывшего подписчика."""
+    TimelineEntry.objects.remove(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_state(sender, instance, raw, **kwargs):
+    """Запоминает прежние группу и картинку редактируемого поста,
+    чтобы сбросить ленту группы и освободить картинку, и загружена ли
+    новая картинка: её сохранение возьмёт на файл ещё одну ссылку.
+    """
+    instance._old_group_slug = instance._old_image = None
+    instance._image_uploaded = bool(
+        instance.image and not instance.image._committed
+    )
+    if not raw and not instance._state.adding:
+        old_state = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group__slug', 'image').first()
+        if old_state:
+            instance._old_group_slug, instance._old_image = old_state
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, created, raw, **kwargs):
+    """Освобождает картинку, заменённую при правке поста.
+
+    Если заново загружена та же картинка, у файла то же имя, но
+    хранилище взяло на него вторую ссылку, и прежняя отпускается.
+    """
+    old_image = getattr(instance, '_old_image', None)
+    if raw or not old_image:
+        return
+    if old_image != instance.image.name or instance._image_uploaded:
+        release_image(old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    """Освобождает картинку удалённого поста."""
+    release_image(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, **kwargs):
+    """Сбрасывает кэш лент при создании, правке и удалении поста."""
+    if kwargs.get('raw'):
+        return
+    scopes = post_feed_scopes(instance) + [f'post:{instance.pk}']
+    old_group_slug = getattr(instance, '_old_group_slug', None)
+    if old_group_slug:
+        scopes.append(f'group:{old_group_slug}')
+    bump_feed_versions(scopes)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_feeds(sender, instance, **kwargs):
+    """Сбрасывает кэш лент со счётчиком комментариев поста при создании
+    и удалении комментария.
+    """
+    if kwargs.get('raw') or kwargs.get('created') is False:
+        return
+    bump_feed_versions(post_feed_scopes(instance.post))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_post_page(sender, instance, **kwargs):
+    """Меняет версию страницы поста при изменении его комментариев."""
+    if not kwargs.get('raw'):
+        bump_feed_versions([f'post:{instance.post_id}'])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_profile(sender, instance, **kwargs):
+    """Сбрасывает кэш профиля автора с кнопкой подписки."""
+    if not kwargs.get('raw'):
+        bump_feed_versions([f'author:{instance.author.username}'])
+
+
+@receiver(pre_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def remember_group_feeds(sender, instance, **kwargs):
+    """Запоминает ленты с карточками постов группы до её правки или
+    удаления: в карточках есть ссылка на группу.
+    """
+    instance._feed_scopes = []
+    if kwargs.get('raw') or instance._state.adding:
+        return
+    old_slug = Group.objects.filter(pk=instance.pk).values_list(
+        'slug', flat=True
+    ).first()
+    if old_slug is None:
+        return
+    authors = Post.objects.filter(group_id=instance.pk).values_list(
+        'author__username', flat=True
+    ).distinct()
+    instance._feed_scopes = [
+        'index', f'group:{old_slug}', *(f'author:{name}' for name in authors)
+    ]
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_feeds(sender, instance, **kwargs):
+    """Сбрасывает кэш лент после правки или удаления группы."""
+    scopes = getattr(instance, '_feed_scopes', None)
+    if scopes:
+        bump_feed_versions(scopes + [f'group:{instance.slug}'])
+
+
+def restore_search_index(sender, using, **kwargs):
+    """Возвращает триггеры поискового индекса после миграций,
+    пересоздающих таблицы постов и комментариев.
+    """
+    restore_search_triggers(connections[using])
@@ -0,0 +1,25 @@
+import logging
+from django import template
+from ..thumbnails import image_sources
+
+
+logger = logging.getLogger(__name__)
+
+register = template.Library()
+
+# Карточка занимает всю ширину колонки, но не больше 960px.
+DEFAULT_SIZES = '(max-width: 992px) 100vw, 960px'
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(image, sizes=DEFAULT_SIZES, lazy=True):
+    """Выводит картинку поста с srcset из заранее созданных миниатюр."""
+    if not image:
+        return {}
+    try:
+        sources = image_sources(image)
+    except Exception:
+        # Как и тег {% thumbnail %}, не роняем страницу из-за картинки.
+        logger.exception('Не удалось вывести картинку %s', image)
+        return {}
+    return {**sources, 'sizes': sizes, 'lazy': lazy}
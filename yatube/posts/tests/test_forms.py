@@ -1,13 +1,37 @@
+import hashlib
+import os
 import shutil
+import struct
 import tempfile
+import threading
+import zlib
+from io import BytesIO, StringIO
+from unittest import mock
 from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
-from ..models import Comment, Group, Post, User
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings
+)
+from core.models import StoredFile
+from PIL import Image
+from sorl.thumbnail.models import KVStore
+from ..models import Comment, Group, Post, TimelineEntry, User
+from ..thumbnails import POST_IMAGE_WIDTHS
 from django.urls import reverse
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -27,14 +51,7 @@ class PostFormTests(TestCase):
             author=cls.author,
             group=cls.group
         )
-        cls.test_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x02\x00'
-            b'\x01\x00\x80\x00\x00\x00\x00\x00'
-            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
-            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
-            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
-            b'\x0A\x00\x3B'
-        )
+        cls.test_gif = GIF
         cls.uploaded = SimpleUploadedFile(
             name='test.gif',
             content=cls.test_gif,
@@ -52,9 +69,13 @@ class PostFormTests(TestCase):
         self.author_client.force_login(PostFormTests.author)
         self.posts_count = Post.objects.count()
         self.comments_count = Comment.objects.count()
+        # Одинаковые картинки получают одно имя, а записи о миниатюрах
+        # в кэше переживают откат базы после теста.
+        caches[settings.THUMBNAIL_CACHE].clear()
 
     def test_create_form(self):
         """Валидная форма создает запись в Post."""
+        digest = hashlib.sha256(GIF).hexdigest()
         form_data = {
             'text': 'Text text2',
             'author': PostFormTests.author,
@@ -79,10 +100,71 @@ class PostFormTests(TestCase):
                 text='Text text2',
                 author=self.author,
                 group=self.group,
-                image='posts/test.gif',
+                image=f'posts/{digest[:2]}/{digest}.gif',
             ).exists()
         )
 
+    def upload_png(self, size):
+        content = BytesIO()
+        Image.new('RGB', size).save(content, 'PNG')
+        return self.author_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Post with png',
+                'image': SimpleUploadedFile(
+                    'big.png', content.getvalue(), content_type='image/png'
+                ),
+            },
+        )
+
+    @override_settings(UPLOAD_MAX_BYTES=10)
+    def test_upload_over_byte_budget_is_rejected(self):
+        """Файл больше UPLOAD_MAX_BYTES отклоняется с ошибкой формы."""
+        response = self.upload_png((20, 10))
+        self.assertTrue(response.context['form'].has_error('image'))
+        self.assertEqual(Post.objects.count(), self.posts_count)
+
+    @override_settings(UPLOAD_MAX_PIXELS=100)
+    def test_upload_over_pixel_budget_is_rejected(self):
+        """Картинка больше UPLOAD_MAX_PIXELS отклоняется по заголовку."""
+        response = self.upload_png((20, 10))
+        self.assertTrue(response.context['form'].has_error('image'))
+        self.assertEqual(Post.objects.count(), self.posts_count)
+
+    def test_decompression_bomb_is_rejected(self):
+        """Картинка, которую Pillow не открывает как «бомбу»,
+        отклоняется как превысившая бюджет пикселей.
+        """
+        content = BytesIO()
+        Image.new('RGB', (1, 1)).save(content, 'PNG')
+        png = content.getvalue()
+        # Заголовок IHDR с размерами 100000×100000 и его контрольной суммой.
+        chunk = b'IHDR' + struct.pack('>II', 100000, 100000) + png[24:29]
+        png = (
+            png[:12] + chunk + struct.pack('>I', zlib.crc32(chunk))
+            + png[33:]
+        )
+        response = self.author_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Post with bomb',
+                'image': SimpleUploadedFile(
+                    'bomb.png', png, content_type='image/png'
+                ),
+            },
+        )
+        self.assertIn(
+            'слишком большая', response.context['form'].errors['image'][0]
+        )
+        self.assertEqual(Post.objects.count(), self.posts_count)
+
+    @override_settings(POST_IMAGE_MAX_SIDE=8)
+    def test_upload_is_downscaled(self):
+        """Оригинал картинки уменьшается до POST_IMAGE_MAX_SIDE."""
+        self.upload_png((20, 10))
+        post = Post.objects.get(text='Post with png')
+        self.assertEqual((post.image.width, post.image.height), (8, 4))
+
     def test_edit_form(self):
         """Валидная форма редактирует запись в Post."""
         post = Post.objects.get(
@@ -113,3 +195,226 @@ class PostFormTests(TestCase):
                 group=self.group,
             ).exists()
         )
+
+    def test_generate_thumbnails_command(self):
+        """generate_thumbnails заранее создаёт миниатюры картинок."""
+        Post.objects.create(
+            text='Post with image',
+            author=PostFormTests.author,
+            image=SimpleUploadedFile(
+                name='thumb.gif',
+                content=PostFormTests.test_gif,
+                content_type='image/gif'
+            ),
+        )
+        call_command('generate_thumbnails', stdout=StringIO())
+        thumbnails_dir = os.path.join(TEMP_MEDIA_ROOT, 'cache')
+        self.assertTrue(
+            any(files for _, _, files in os.walk(thumbnails_dir))
+        )
+
+    def test_warm_thumbnails_command(self):
+        """warm_thumbnails переносит записи о миниатюрах в кэш."""
+        Post.objects.create(
+            text='Post with image',
+            author=PostFormTests.author,
+            image=SimpleUploadedFile(
+                name='warm.gif',
+                content=PostFormTests.test_gif,
+                content_type='image/gif'
+            ),
+        )
+        call_command('generate_thumbnails', stdout=StringIO())
+        thumbnails_cache = caches[settings.THUMBNAIL_CACHE]
+        thumbnails_cache.clear()
+        call_command('warm_thumbnails', stdout=StringIO())
+        key = KVStore.objects.values_list('key', flat=True).first()
+        self.assertIsNotNone(thumbnails_cache.get(key))
+
+    def test_post_image_has_srcset(self):
+        """Картинка поста выводится с srcset из миниатюр всех ширин."""
+        post = Post.objects.create(
+            text='Post with image',
+            author=PostFormTests.author,
+            image=SimpleUploadedFile(
+                name='srcset.gif',
+                content=PostFormTests.test_gif,
+                content_type='image/gif'
+            ),
+        )
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertContains(response, 'srcset=')
+        for width in POST_IMAGE_WIDTHS:
+            self.assertContains(response, f' {width}w')
+
+
+HASHED_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+# Миниатюры создаются в потоке запроса: из пула они дописывались бы
+# в HASHED_MEDIA_ROOT, когда тест его уже удаляет.
+@override_settings(MEDIA_ROOT=HASHED_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class HashedImageStorageTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(HASHED_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='Author')
+
+    def create_post(self, name):
+        return Post.objects.create(
+            text='Post with image',
+            author=self.author,
+            image=SimpleUploadedFile(
+                name=name, content=GIF, content_type='image/gif'
+            ),
+        )
+
+    def test_same_image_is_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом, который удаляется
+        вместе с последним ссылающимся на него постом.
+        """
+        first = self.create_post('first.gif')
+        second = self.create_post('second.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        storage = first.image.storage
+        first.delete()
+        self.assertTrue(storage.exists(second.image.name))
+        second.delete()
+        self.assertFalse(storage.exists(second.image.name))
+
+    def test_same_image_reuploaded_on_edit(self):
+        """Повторная загрузка той же картинки при правке поста не
+        оставляет лишней ссылки на файл.
+        """
+        post = self.create_post('first.gif')
+        client = Client()
+        client.force_login(self.author)
+        response = client.post(
+            reverse('posts:post_edit', args=(post.pk,)),
+            data={
+                'text': 'Edited post',
+                'image': SimpleUploadedFile(
+                    name='again.gif', content=GIF, content_type='image/gif'
+                ),
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Edited post')
+        stored = StoredFile.objects.get(name=post.image.name)
+        self.assertEqual(stored.references, 1)
+        storage = post.image.storage
+        post.delete()
+        self.assertFalse(storage.exists(stored.name))
+
+    def test_upload_during_release_keeps_file(self):
+        """Картинка, которую загрузка уже переиспользовала, не удаляется
+        с последним сохранённым постом: загрузка держит на неё ссылку.
+        """
+        first = self.create_post('first.gif')
+        storage = first.image.storage
+        # Та же картинка загружена, но пост с ней ещё не сохранён.
+        name = storage.save('posts/second.gif', ContentFile(GIF))
+        self.assertEqual(name, first.image.name)
+        first.delete()
+        self.assertTrue(storage.exists(name))
+        second = Post.objects.create(
+            text='Post with image', author=self.author, image=name
+        )
+        second.delete()
+        self.assertFalse(storage.exists(name))
+
+    def test_hash_images_command(self):
+        """hash_images переносит старые картинки под имена по хешу."""
+        post = self.create_post('post.gif')
+        hashed_name = post.image.name
+        post.image.storage.delete(hashed_name)
+        with open(os.path.join(HASHED_MEDIA_ROOT, 'old.gif'), 'wb') as file:
+            file.write(GIF)
+        Post.objects.filter(pk=post.pk).update(image='old.gif')
+        call_command('hash_images', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, hashed_name)
+        self.assertTrue(post.image.storage.exists(hashed_name))
+        self.assertFalse(post.image.storage.exists('old.gif'))
+
+
+@override_settings(MEDIA_ROOT=HASHED_MEDIA_ROOT, THUMBNAIL_WORKERS=1)
+class ThumbnailQueueTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(HASHED_MEDIA_ROOT, ignore_errors=True)
+
+    def test_post_create_does_not_wait_for_thumbnails(self):
+        """Создание поста не ждёт миниатюр: они создаются в пуле потоков."""
+        started, release, done = (threading.Event() for _ in range(3))
+
+        def slow_generate(name):
+            started.set()
+            release.wait(5)
+            done.set()
+
+        client = Client()
+        client.force_login(User.objects.create_user(username='Author'))
+        with mock.patch('posts.thumbnails.generate_thumbnails', slow_generate):
+            response = client.post(reverse('posts:post_create'), {
+                'text': 'Post with image',
+                'image': SimpleUploadedFile(
+                    name='post.gif', content=GIF, content_type='image/gif'
+                ),
+            })
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(started.wait(5))
+            self.assertFalse(done.is_set())
+            release.set()
+            self.assertTrue(done.wait(5))
+
+
+SEED_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=SEED_MEDIA_ROOT)
+class SeedCommandTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(SEED_MEDIA_ROOT, ignore_errors=True)
+
+    def seed(self):
+        call_command(
+            'seed_yatube', users=20, groups=3, posts=200, comments=300,
+            follows=60, images=2, stdout=StringIO(),
+        )
+        return list(Post.objects.order_by('pk').values_list(
+            'text', 'author__username', 'group__slug', 'image', 'pub_date'
+        ))
+
+    def test_seed_fills_consistent_data(self):
+        """seed_yatube заполняет базу с верными счётчиками и лентами."""
+        self.seed()
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertTrue(Post.objects.exclude(image=''))
+        self.assertEqual(
+            sum(Post.objects.values_list('comments_count', flat=True)), 300
+        )
+        self.assertTrue(TimelineEntry.objects.exists())
+        stdout = StringIO()
+        call_command('recount_counters', stdout=stdout)
+        self.assertIn('Исправлено счётчиков: 0', stdout.getvalue())
+
+    def test_seed_is_deterministic(self):
+        """При одном seed данные получаются одинаковыми."""
+        first = self.seed()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        second = self.seed()
+        self.assertEqual(
+            [row[:4] for row in first], [row[:4] for row in second]
+        )
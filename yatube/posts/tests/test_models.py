@@ -1,5 +1,17 @@
-from django.test import TestCase
-from ..models import Group, Post, User
+import importlib
+from io import StringIO
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from core.paginators import CursorPaginator
+from core.routers import ReplicaMiddleware
+from core.testing import lagging_replica
+from ..models import (AuthorStats, Comment, Follow, Group, Post,
+                      TimelineEntry, User)
 
 
 class PostModelTest(TestCase):
@@ -57,3 +69,257 @@ class PostModelTest(TestCase):
                     PostModelTest.post._meta.get_field(field)
                                       .help_text, expected_value
                 )
+
+
+class CommentsCountTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Test text',
+        )
+
+    def test_comments_count_follows_comments(self):
+        """Счётчик комментариев меняется при создании и удалении."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Test comment'
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_recount_counters_fixes_drift(self):
+        """recount_counters восстанавливает разошедшийся счётчик."""
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=self.user, text='Test comment')
+            for _ in range(3)
+        ])
+        call_command('recount_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 3)
+
+
+class AuthorStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='TestAuthor')
+        cls.reader = User.objects.create_user(username='TestReader')
+
+    def test_stats_follow_writes(self):
+        """Статистика автора обновляется при создании и удалении
+        постов, комментариев и подписок.
+        """
+        post = Post.objects.create(author=self.author, text='Test text')
+        Comment.objects.create(post=post, author=self.reader, text='Test')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        author_stats = AuthorStats.objects.get(user=self.author)
+        reader_stats = AuthorStats.objects.get(user=self.reader)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(reader_stats.comments_count, 1)
+        self.assertEqual(reader_stats.following_count, 1)
+        follow.delete()
+        post.delete()
+        author_stats.refresh_from_db()
+        reader_stats.refresh_from_db()
+        self.assertEqual(author_stats.posts_count, 0)
+        self.assertEqual(author_stats.followers_count, 0)
+        self.assertEqual(reader_stats.comments_count, 0)
+        self.assertEqual(reader_stats.following_count, 0)
+
+    def test_for_author_reads_selected_stats(self):
+        """for_author не делает запросов для автора с select_related."""
+        Post.objects.create(author=self.author, text='Test text')
+        author = User.objects.select_related('stats').get(pk=self.author.pk)
+        with self.assertNumQueries(0):
+            stats = AuthorStats.objects.for_author(author)
+        self.assertEqual(stats.posts_count, 1)
+
+    def test_recount_counters_fixes_author_stats(self):
+        """recount_counters создаёт и исправляет статистику авторов."""
+        Post.objects.bulk_create([
+            Post(author=self.author, text='Test text') for _ in range(2)
+        ])
+        AuthorStats.objects.all().delete()
+        call_command('recount_counters', stdout=StringIO())
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).posts_count, 2
+        )
+        self.assertTrue(AuthorStats.objects.filter(user=self.reader).exists())
+
+    def test_migration_fills_stats_of_many_authors(self):
+        """Миграция заполняет статистику больше чем 500 авторов:
+        bulk_create на SQLite вставляет не больше 500 строк за запрос.
+        """
+        User.objects.bulk_create(
+            [User(username=f'user{number}') for number in range(501)]
+        )
+        AuthorStats.objects.all().delete()
+        migration = importlib.import_module(
+            'posts.migrations.0015_authorstats'
+        )
+        migration.fill_author_stats(apps, None)
+        self.assertEqual(AuthorStats.objects.count(), User.objects.count())
+
+
+class AuthorStatsReplicaTest(TransactionTestCase):
+    def test_recount_ignores_lagging_replica(self):
+        """Недостающая статистика пересчитывается по основной базе,
+        даже если запрос читает из отстающей реплики.
+        """
+        author = User.objects.create_user(username='TestAuthor')
+        Post.objects.create(author=author, text='Test text')
+        AuthorStats.objects.all().delete()
+        with lagging_replica():
+            Post.objects.create(author=author, text='Test text')
+            AuthorStats.objects.all().delete()
+            result = {}
+
+            def view(request):
+                result['stats'] = AuthorStats.objects.for_author(author)
+                return HttpResponse()
+
+            ReplicaMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(result['stats'].posts_count, 2)
+        self.assertEqual(
+            AuthorStats.objects.get(user=author).posts_count, 2
+        )
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='TestAuthor')
+        cls.reader = User.objects.create_user(username='TestReader')
+        cls.old_post = Post.objects.create(author=cls.author, text='Old')
+
+    def test_timeline_follows_writes(self):
+        """Подписка заполняет ленту, новый пост раскладывается
+        по лентам, отписка очищает ленту.
+        """
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='New')
+        self.assertEqual(
+            set(TimelineEntry.objects.posts_for(self.reader)),
+            {self.old_post, new_post},
+        )
+        Follow.objects.filter(user=self.reader, author=self.author).delete()
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+
+    def test_unfollow_does_not_reread_users(self):
+        """Отписка удаляет подписку, обновляет счётчики и ленту,
+        не перечитывая подписчика и автора.
+        """
+        Follow.objects.create(user=self.reader, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(Follow.objects.unfollow(self.reader, self.author))
+        statements = [query['sql'] for query in queries]
+        self.assertFalse(
+            [sql for sql in statements if 'auth_user' in sql], statements
+        )
+        self.assertEqual(
+            len([sql for sql in statements if sql.startswith('DELETE')]), 2
+        )
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).followers_count, 0
+        )
+        self.assertFalse(Follow.objects.unfollow(self.reader, self.author))
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_popular_author_is_merged_on_read(self):
+        """Посты автора с большим числом подписчиков не раскладываются,
+        а подмешиваются в ленту при чтении.
+        """
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='New')
+        self.assertFalse(TimelineEntry.objects.filter(post=new_post))
+        self.assertIn(new_post, TimelineEntry.objects.posts_for(self.reader))
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_window_pages_match_posts_for(self):
+        """Страницы ленты, собранные слиянием окон ленты и подмешиваемых
+        авторов, совпадают со страницами всего posts_for.
+        """
+        popular = User.objects.create_user(username='Popular')
+        Follow.objects.create(user=self.author, author=popular)
+        Follow.objects.create(user=self.reader, author=popular)
+        Follow.objects.create(user=self.reader, author=self.author)
+        for number in range(7):
+            Post.objects.create(author=popular, text=f'Popular {number}')
+            Post.objects.create(author=self.author, text=f'Author {number}')
+        posts = TimelineEntry.objects.posts_for(self.reader)
+        expected = list(posts.order_by('-pub_date', '-id'))
+        self.assertEqual(len(expected), 15)
+        window = TimelineEntry.objects.window_for(self.reader)
+        paginator = CursorPaginator(posts, 4, window=window)
+        pages, page = [], paginator.get_cursor_page()
+        while True:
+            pages.append(list(page.object_list))
+            if page.next_cursor is None:
+                break
+            page = paginator.get_cursor_page(after=page.next_cursor)
+        self.assertEqual(sum(pages, []), expected)
+        page = paginator.get_cursor_page(before=page.previous_cursor)
+        self.assertEqual(list(page.object_list), pages[-2])
+
+    @override_settings(TIMELINE_LENGTH=600)
+    def test_timelines_over_500_entries(self):
+        """Раскладка, заполнение ленты при подписке и миграция
+        справляются больше чем с 500 записями: bulk_create на SQLite
+        вставляет не больше 500 строк за запрос.
+        """
+        User.objects.bulk_create(
+            [User(username=f'reader{number}') for number in range(501)]
+        )
+        readers = User.objects.filter(username__startswith='reader')
+        Follow.objects.bulk_create(
+            [Follow(user=reader, author=self.author) for reader in readers]
+        )
+        post = Post.objects.create(author=self.author, text='Fan-out')
+        self.assertEqual(
+            TimelineEntry.objects.filter(post=post).count(), len(readers)
+        )
+        Post.objects.bulk_create(
+            [Post(author=self.author, text='Post') for _ in range(500)]
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.reader
+        ).count(), 502)
+        TimelineEntry.objects.all().delete()
+        migration = importlib.import_module(
+            'posts.migrations.0016_timelineentry'
+        )
+        migration.fill_timelines(apps, None)
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.reader
+        ).count(), 502)
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_rebuild_matches_fan_out(self):
+        """rebuild восстанавливает ленты так же, как их ведут сигналы."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        for i in range(3):
+            Post.objects.create(author=self.author, text=f'Post {i}')
+        entries = set(TimelineEntry.objects.values_list('user', 'post'))
+        TimelineEntry.objects.rebuild()
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list('user', 'post')), entries
+        )
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_timeline_is_trimmed(self):
+        """Лента читателя ограничена TIMELINE_LENGTH постами."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        for i in range(3):
+            Post.objects.create(author=self.author, text=f'Post {i}')
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 2
+        )
@@ -1,12 +1,19 @@
 import shutil
 import tempfile
+from http import HTTPStatus
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings
+)
 from django.urls import reverse
+from django.utils.http import http_date
 from django import forms
-from ..models import Comment, Follow, Group, Post, User
+from core.instrumentation import QueryBudgetExceeded
+from core.routers import PIN_COOKIE
+from core.testing import lagging_replica
+from ..models import AuthorStats, Comment, Follow, Group, Post, User
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -175,22 +182,116 @@ class PostPagesTests(TestCase):
             self.assertNotEqual(form_obj_0.group.slug, group_2.slug)
 
     def test_index_cache(self):
-        """Проверка работы кэша"""
+        """Проверка работы кэша: страница отдаётся из кэша,
+        пока посты не изменились, и сбрасывается при удалении поста.
+        """
         post = Post.objects.create(
             author=PostPagesTests.author,
             text='Test cache'
         )
         response = self.guest_client.get(reverse('posts:index'))
         content = response.content
-        post.delete()
+        Post.objects.filter(pk=post.pk).update(text='Changed silently')
         response_2 = self.guest_client.get(reverse('posts:index'))
         content_2 = response_2.content
         self.assertEqual(content, content_2)
-        cache.clear()
+        post.delete()
         response_3 = self.guest_client.get(reverse('posts:index'))
         content_3 = response_3.content
         self.assertNotEqual(content, content_3)
 
+    def test_feed_caches_invalidated_by_comment(self):
+        """Новый и удалённый комментарий сбрасывают кэш лент с его
+        постом.
+        """
+        pages_names = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.post.author}),
+        ]
+        for address in pages_names:
+            self.guest_client.get(address)
+        comment = Comment.objects.create(
+            post=self.post, author=self.authorized, text='Test comment'
+        )
+        etags = {}
+        for address in pages_names:
+            with self.subTest(address=address):
+                response = self.guest_client.get(address)
+                self.assertContains(response, 'Комментарии: 1')
+                etags[address] = response['ETag']
+        comment.delete()
+        for address in pages_names:
+            with self.subTest(address=address):
+                response = self.guest_client.get(
+                    address, HTTP_IF_NONE_MATCH=etags[address]
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertNotContains(response, 'Комментарии: 1')
+
+    def test_unchanged_pages_are_not_modified(self):
+        """Неизменившиеся ленты и страница поста отдаются как 304
+        по ETag.
+        """
+        for address in self.conditional_pages():
+            with self.subTest(address=address):
+                response = self.authorized_client.get(address)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                response_2 = self.authorized_client.get(
+                    address, HTTP_IF_NONE_MATCH=response['ETag']
+                )
+                self.assertEqual(
+                    response_2.status_code, HTTPStatus.NOT_MODIFIED
+                )
+
+    def test_pages_have_no_last_modified(self):
+        """Last-Modified не отправляется, а по одному If-Modified-Since
+        не отдаётся 304: изменение в ту же секунду не должно теряться.
+        """
+        for address in self.conditional_pages():
+            with self.subTest(address=address):
+                response = self.authorized_client.get(address)
+                self.assertFalse(response.has_header('Last-Modified'))
+                Comment.objects.create(
+                    post=self.post, author=self.authorized, text='Again'
+                )
+                response = self.authorized_client.get(
+                    address, HTTP_IF_MODIFIED_SINCE=http_date()
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_changed_pages_are_sent_again(self):
+        """После нового комментария и другому пользователю страницы
+        отдаются целиком.
+        """
+        etags = {
+            address: self.authorized_client.get(address)['ETag']
+            for address in self.conditional_pages()
+        }
+        for address, etag in etags.items():
+            with self.subTest(address=address):
+                response = self.not_follower_client.get(
+                    address, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+        Comment.objects.create(
+            post=self.post, author=self.authorized, text='Test comment'
+        )
+        for address, etag in etags.items():
+            with self.subTest(address=address):
+                response = self.authorized_client.get(
+                    address, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def conditional_pages(self):
+        return [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.post.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        ]
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -238,6 +339,41 @@ class PaginatorViewsTest(TestCase):
                         .paginator.page(i + 1)
                         .object_list.count(), num)
 
+    def test_cursor_pages_are_stable_across_inserts(self):
+        """Ссылки по курсору не сдвигаются после добавления поста."""
+        address = reverse('posts:index')
+        first_page = self.guest_client.get(address).context['page_obj']
+        self.assertIsNone(first_page.previous_cursor)
+        next_cursor = first_page.next_cursor
+        second_page = self.guest_client.get(
+            address, {'after': next_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertIsNone(second_page.next_cursor)
+        Post.objects.create(author=self.author, text='Новый пост')
+        cache.clear()
+        second_page_again = self.guest_client.get(
+            address, {'after': next_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            list(second_page_again.object_list),
+            list(second_page.object_list),
+        )
+        previous_page = self.guest_client.get(
+            address, {'before': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            list(previous_page.object_list),
+            list(first_page.object_list),
+        )
+
+    def test_broken_cursor_returns_first_page(self):
+        """Некорректный курсор отдаёт первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:index'), {'after': 'broken'}
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+
 
 class CommentPagesTests(TestCase):
     @classmethod
@@ -271,6 +407,45 @@ class CommentPagesTests(TestCase):
             form_obj = response.context.get('comments')[0]
             self.assertEqual(form_obj.text, CommentPagesTests.comment.text)
 
+    @override_settings(COMMENTS_LIMIT=2)
+    def test_comments_are_paginated(self):
+        """На странице поста первая страница комментариев, следующие
+        отдаются фрагментом по курсору; у несуществующего поста
+        фрагмента нет.
+        """
+        for number in range(2):
+            Comment.objects.create(
+                post=self.post, author=self.author, text=f'Comment {number}'
+            )
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        )
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            ['Test comment', 'Comment 0'],
+        )
+        fragment = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.id}),
+            {'after': comments.next_cursor},
+        )
+        self.assertTemplateUsed(fragment, 'posts/includes/comment_list.html')
+        self.assertTemplateNotUsed(fragment, 'base.html')
+        self.assertEqual(
+            [comment.text for comment in fragment.context['comments']],
+            ['Comment 1'],
+        )
+        self.assertIsNone(fragment.context['comments'].next_cursor)
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.id}),
+            {'after': fragment.context['comments'].previous_cursor},
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0})
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
     def test_post_can_comments_authorized_client(self):
         """Авторизованный пользователь может комментировать посты."""
         form_data = {
@@ -384,6 +559,39 @@ class FollowPagesTests(TestCase):
             ).exists()
         )
 
+    def test_follow_is_idempotent_and_answers_ajax(self):
+        """Повторная подписка не создаёт дублей, AJAX-запросы
+        получают JSON вместо перехода на профиль.
+        """
+        follow_url = reverse(
+            'posts:profile_follow',
+            kwargs={'username': FollowPagesTests.author}
+        )
+        for _ in range(2):
+            response = self.follower_client.get(
+                follow_url, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+            )
+            self.assertEqual(response.json(), {'following': True})
+        self.assertEqual(
+            Follow.objects.filter(
+                author=FollowPagesTests.author,
+                user=FollowPagesTests.follower
+            ).count(), 1
+        )
+        response = self.follower_client.get(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': FollowPagesTests.author}
+            ),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.json(), {'following': False})
+        self.assertEqual(
+            AuthorStats.objects.get(
+                user=FollowPagesTests.author
+            ).followers_count, 0
+        )
+
     def test_new_post_appears_only_in_followers_list(self):
         """Новая запись пользователя появляется в ленте тех, кто на него
         подписан и не появляется в ленте тех, кто не подписан.
@@ -404,3 +612,305 @@ class FollowPagesTests(TestCase):
         self.assertEqual(response_3.context['page_obj']
                          .paginator.page(1)
                          .object_list.count(), 0)
+
+    def test_post_card_is_cached_until_edit(self):
+        """Карточка поста берётся из кэша, пока пост не изменён."""
+        Follow.objects.create(
+            user=FollowPagesTests.follower, author=FollowPagesTests.author
+        )
+        cache.clear()
+        self.follower_client.get(reverse('posts:follow_index'))
+        Post.objects.filter(pk=FollowPagesTests.post.pk).update(
+            text='Changed silently'
+        )
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertNotContains(response, 'Changed silently')
+        post = Post.objects.get(pk=FollowPagesTests.post.pk)
+        post.text = 'Edited text'
+        post.save()
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Edited text')
+
+    def test_group_edit_refreshes_post_cards(self):
+        """Правка группы сразу меняет ссылку на неё в карточках
+        и в закэшированных лентах.
+        """
+        group = Group.objects.create(title='Test group', slug='old-slug')
+        Post.objects.filter(pk=FollowPagesTests.post.pk).update(group=group)
+        cache.clear()
+        self.author_client.get(reverse('posts:index'))
+        group.slug = 'new-slug'
+        group.save()
+        response = self.author_client.get(reverse('posts:index'))
+        self.assertContains(
+            response, reverse('posts:group_list', args=('new-slug',))
+        )
+        self.assertNotContains(response, 'old-slug')
+
+
+class FollowReplicaTests(TransactionTestCase):
+    def test_follow_by_get_pins_reads_to_primary(self):
+        """После подписки запросом GET лента подписок читается
+        из основной базы, а не из отстающей реплики.
+        """
+        author = User.objects.create_user(username='Author')
+        follower = User.objects.create_user(username='Follower')
+        Post.objects.create(text='Test text', author=author)
+        client = Client()
+        client.force_login(follower)
+        with lagging_replica():
+            response = client.get(
+                reverse('posts:profile_follow', args=(author.username,))
+            )
+            self.assertIn(PIN_COOKIE, response.cookies)
+            response = client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Test text')
+
+
+class FeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.group = Group.objects.create(
+            title='Test group', slug='test-slug', description='Test'
+        )
+        cls.post = Post.objects.create(
+            text='Syndicated post', author=cls.author, group=cls.group
+        )
+        cls.feeds = {
+            reverse('posts:index_rss'): 'application/rss+xml',
+            reverse('posts:index_atom'): 'application/atom+xml',
+            reverse(
+                'posts:group_rss', kwargs={'slug': 'test-slug'}
+            ): 'application/rss+xml',
+            reverse(
+                'posts:group_atom', kwargs={'slug': 'test-slug'}
+            ): 'application/atom+xml',
+            reverse(
+                'posts:author_rss', kwargs={'username': 'Author'}
+            ): 'application/rss+xml',
+            reverse(
+                'posts:author_atom', kwargs={'username': 'Author'}
+            ): 'application/atom+xml',
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_feeds_list_posts(self):
+        """Ленты RSS и Atom сайта, группы и автора содержат посты."""
+        for address, content_type in FeedTests.feeds.items():
+            with self.subTest(address=address):
+                response = self.guest_client.get(address)
+                self.assertTrue(response['Content-Type'].startswith(
+                    content_type
+                ))
+                self.assertContains(response, 'Syndicated post')
+
+    def test_feeds_answer_conditional_requests(self):
+        """Неизменившиеся ленты отдаются как 304, новый пост
+        сбрасывает их.
+        """
+        etags = {
+            address: self.guest_client.get(address)['ETag']
+            for address in FeedTests.feeds
+        }
+        for address, etag in etags.items():
+            with self.subTest(address=address):
+                response = self.guest_client.get(
+                    address, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED
+                )
+        Post.objects.create(
+            text='Fresh post', author=FeedTests.author, group=FeedTests.group
+        )
+        for address, etag in etags.items():
+            with self.subTest(address=address):
+                response = self.guest_client.get(
+                    address, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertContains(response, 'Fresh post')
+
+    def test_unknown_group_feed_is_not_found(self):
+        """Лента несуществующей группы отдаёт 404."""
+        response = self.guest_client.get(
+            reverse('posts:group_rss', kwargs={'slug': 'missing'})
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class SearchViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_superuser(
+            username='Author', email='author@example.com', password='pass'
+        )
+        cls.post = Post.objects.create(
+            text='Заметки о велосипедах',
+            author=cls.author,
+        )
+        cls.other_post = Post.objects.create(
+            text='Рецепт пирога',
+            author=cls.author,
+        )
+        Comment.objects.create(
+            post=cls.other_post, author=cls.author, text='Добавьте корицу'
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(SearchViewTests.author)
+
+    def search(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        return response.context['posts']
+
+    def test_search_finds_post_by_text_prefix(self):
+        """Поиск находит пост по началу слова из его текста."""
+        self.assertEqual(self.search('велосипед'), [SearchViewTests.post])
+
+    def test_search_finds_post_by_comment(self):
+        """Поиск находит пост по тексту комментария к нему."""
+        self.assertEqual(self.search('корицу'), [SearchViewTests.other_post])
+
+    def test_search_follows_edits(self):
+        """Индекс обновляется при изменении текста поста."""
+        post = Post.objects.get(pk=SearchViewTests.post.pk)
+        post.text = 'Заметки о самокатах'
+        post.save()
+        self.assertEqual(self.search('велосипед'), [])
+        self.assertEqual(self.search('самокат'), [post])
+
+    def test_search_ignores_query_syntax(self):
+        """Операторы FTS5 в запросе не ломают поиск."""
+        response = self.client.get(
+            reverse('posts:search'), {'q': '"пирог* -('}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.context['posts'], [SearchViewTests.other_post]
+        )
+
+    def test_search_page_number_is_bounded(self):
+        """Огромный или нечисловой номер страницы не ломает поиск."""
+        for page in ('9' * 30, 'abc', '-5'):
+            with self.subTest(page=page):
+                response = self.client.get(
+                    reverse('posts:search'), {'q': 'пирог', 'page': page}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(
+                    response.context['page_number'], settings.SEARCH_MAX_PAGES
+                )
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке находит посты по индексу."""
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'пирог'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list),
+            [SearchViewTests.other_post],
+        )
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Test group', slug='test-slug', description='Test'
+        )
+        for number in range(settings.PAGES_LIMIT + 3):
+            cls.post = Post.objects.create(
+                text=f'Test text {number}',
+                author=cls.author,
+                group=cls.group,
+            )
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text='Test comment'
+            )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(QueryBudgetTests.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(QueryBudgetTests.reader)
+
+    def test_pages_fit_query_budgets(self):
+        """Страницы укладываются в бюджеты запросов QUERY_BUDGETS."""
+        post = QueryBudgetTests.post
+        author = QueryBudgetTests.author.username
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': author}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': post.pk}),
+            reverse('posts:index_rss'),
+            reverse('posts:group_atom', kwargs={'slug': 'test-slug'}),
+            reverse('posts:author_rss', kwargs={'username': author}),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=text',
+            reverse('posts:post_create'),
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+        )
+        for url in pages:
+            with self.subTest(url=url):
+                self.author_client.get(url)
+                self.reader_client.get(url)
+
+    def test_actions_fit_query_budgets(self):
+        """Создание, правка, комментарии и подписки укладываются
+        в бюджеты запросов.
+        """
+        post = QueryBudgetTests.post
+        author = QueryBudgetTests.author.username
+        self.author_client.post(
+            reverse('posts:post_create'), {'text': 'New post'}
+        )
+        self.author_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            {'text': 'Edited post'},
+        )
+        self.reader_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            {'text': 'New comment'},
+        )
+        for name in ('profile_unfollow', 'profile_follow'):
+            self.reader_client.get(
+                reverse(f'posts:{name}', kwargs={'username': author})
+            )
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 0})
+    def test_budget_overrun_fails(self):
+        """Превышение бюджета запросов роняет запрос в любом тесте."""
+        self.assertTrue(settings.QUERY_BUDGETS_ENFORCE)
+        with self.assertRaises(QueryBudgetExceeded):
+            self.author_client.get(reverse('posts:index'))
+
+    def test_recount_is_not_budgeted(self):
+        """Разовый пересчёт отсутствующей статистики автора не входит
+        в бюджет страницы профиля.
+        """
+        AuthorStats.objects.filter(user=QueryBudgetTests.author).delete()
+        response = self.reader_client.get(
+            reverse(
+                'posts:profile',
+                kwargs={'username': QueryBudgetTests.author.username},
+            )
+        )
+        self.assertGreater(response.request_stats.unbudgeted_queries, 0)
+        self.assertEqual(
+            response.context['author_stats'].posts_count,
+            settings.PAGES_LIMIT + 3,
+        )
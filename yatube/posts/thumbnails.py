@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections, router, transaction
+from PIL import features
+from sorl.thumbnail import delete, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+from core.instrumentation import unbudgeted
+from core.metrics import THUMBNAIL_DURATION
+from .models import Post
+
+
+logger = logging.getLogger(__name__)
+
+# Ширины картинки поста для srcset; пропорции у всех как у 960x339.
+POST_IMAGE_WIDTHS = (320, 640, 960)
+POST_IMAGE_OPTIONS = {'padding': True, 'upscale': True}
+# WebP отдаётся браузерам, которые его понимают, остальные получают
+# JPEG. Без поддержки WebP в Pillow создаются только JPEG.
+WEBP_OPTIONS = {'format': 'WEBP', 'quality': 80}
+WEBP_SUPPORTED = features.check('webp')
+
+
+def _geometry(width):
+    return f'{width}x{round(width * 339 / 960)}'
+
+
+def _variants():
+    formats = [{}]
+    if WEBP_SUPPORTED:
+        formats.append(WEBP_OPTIONS)
+    return tuple(
+        (_geometry(width), {**POST_IMAGE_OPTIONS, **extra})
+        for extra in formats
+        for width in POST_IMAGE_WIDTHS
+    )
+
+
+# Миниатюры, которые запрашивают шаблоны: геометрия и опции
+# должны совпадать с image_sources, иначе ключ кэша другой.
+POST_THUMBNAILS = _variants()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def post_image_file(name):
+    """Картинка поста по имени в хранилище поля Post.image: от хранилища
+    зависят ключи миниатюр, по которым их находят шаблоны.
+    """
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def generate_thumbnails(image):
+    """Создаёт все миниатюры картинки поста, которые нужны шаблонам."""
+    image = post_image_file(image)
+    for geometry, options in POST_THUMBNAILS:
+        get_thumbnail(image, geometry, **options)
+
+
+def _srcset(thumbnails):
+    return ', '.join(
+        f'{thumbnail.url} {thumbnail.width}w' for thumbnail in thumbnails
+    )
+
+
+def image_sources(image):
+    """Возвращает данные для <picture>: srcset в JPEG и WebP,
+    а также самую широкую JPEG-миниатюру для src. Если картинки
+    нет в хранилище, возвращает пустой словарь.
+
+    Готовые миниатюры находятся в кэше хранилища ключей без запросов;
+    запросы к его таблице бывают, только пока кэш не прогрет или
+    миниатюры ещё не созданы, и в бюджет view не входят.
+    """
+    thumbnails = {}
+    with unbudgeted():
+        for geometry, options in POST_THUMBNAILS:
+            thumbnail = get_thumbnail(image, geometry, **options)
+            if thumbnail.size is None:
+                return {}
+            thumbnails.setdefault(
+                options.get('format'), []
+            ).append(thumbnail)
+    return {
+        'image': thumbnails[None][-1],
+        'srcset': _srcset(thumbnails[None]),
+        'webp_srcset': _srcset(thumbnails.get('WEBP', ())),
+    }
+
+
+def _generate(name):
+    started = time.perf_counter()
+    try:
+        generate_thumbnails(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+    else:
+        THUMBNAIL_DURATION.observe(time.perf_counter() - started)
+
+
+def _generate_in_thread(name):
+    try:
+        _generate(name)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    """Пул потоков для миниатюр, общий для процесса. Создаётся при
+    первой картинке под блокировкой, чтобы одновременные первые
+    запросы не завели несколько пулов.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    return _executor
+
+
+def _submit(name):
+    if not settings.THUMBNAIL_WORKERS:
+        # Миниатюры создаются один раз, и бюджет запросов view
+        # на них не рассчитан.
+        with unbudgeted():
+            _generate(name)
+        return
+    get_executor().submit(_generate_in_thread, name)
+
+
+def enqueue_thumbnails(post):
+    """Создаёт миниатюры поста после фиксации транзакции:
+    в пуле из THUMBNAIL_WORKERS потоков или, если он 0, сразу
+    в потоке запроса автора. Читатели лент в любом случае получают
+    готовые миниатюры.
+    """
+    if not post.image:
+        return
+    name = post.image.name
+    transaction.on_commit(lambda: _submit(name))
+
+
+def _in_use(name):
+    # Посты, вставленные в обход хранилища (seed_yatube, hash_images),
+    # ссылаются на картинку без счётчика в StoredFile.
+    return Post.objects.using(router.db_for_write(Post)).filter(
+        image=name
+    ).exists()
+
+
+def _delete(name):
+    try:
+        delete(post_image_file(name))
+    except Exception:
+        logger.exception('Не удалось удалить картинку %s', name)
+
+
+def _release(name):
+    Post._meta.get_field('image').storage.release(
+        name, in_use=_in_use, delete=_delete
+    )
+
+
+def release_image(name):
+    """Отпускает картинку после фиксации транзакции; последняя ссылка
+    удаляет её вместе с миниатюрами, если на неё не ссылается ни один
+    пост.
+    """
+    if name:
+        transaction.on_commit(lambda: _release(name))
@@ -0,0 +1,115 @@
+import io
+import os
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image, ImageOps
+
+
+# Заголовка картинки с размерами ищем не дальше этого числа байт.
+HEADER_LIMIT = 256 * 1024
+
+
+def too_many_pixels(image='Картинка'):
+    return (
+        f'{image} слишком большая: не больше '
+        f'{settings.UPLOAD_MAX_PIXELS / 1000000:g} млн пикселей.'
+    )
+
+
+def image_too_large(size):
+    """Текст ошибки, если картинка размера size больше бюджета пикселей."""
+    width, height = size
+    if width * height > settings.UPLOAD_MAX_PIXELS:
+        return too_many_pixels(f'Картинка {width}×{height}')
+    return None
+
+
+def read_image_size(header):
+    """Размеры картинки по началу файла или None, если их ещё нет.
+    Картинку, которую Pillow считает «бомбой», не открывает:
+    DecompressionBombError уходит вызывающему.
+    """
+    try:
+        with Image.open(io.BytesIO(header)) as image:
+            return image.size
+    except (OSError, SyntaxError, ValueError):
+        return None
+
+
+class BoundedUploadHandler(FileUploadHandler):
+    """Проверяет загружаемые файлы, пока они приходят.
+
+    Файл длиннее UPLOAD_MAX_BYTES и картинка, в заголовке которой
+    больше UPLOAD_MAX_PIXELS пикселей (например, «бомба» из маленького
+    PNG), отбрасываются, не дочитываясь до конца и не декодируясь.
+    Вместо них форма получает пустой файл с атрибутом upload_error
+    (см. PostForm).
+    Стоит первым в FILE_UPLOAD_HANDLERS и передаёт данные дальше.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.header = b''
+        self.size_known = False
+        self.error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error:
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_BYTES:
+            self.error = (
+                'Файл слишком большой: не больше '
+                f'{settings.UPLOAD_MAX_BYTES // 1024 // 1024} МБ.'
+            )
+            return None
+        if not self.size_known and len(self.header) < HEADER_LIMIT:
+            self.header += raw_data
+            try:
+                size = read_image_size(self.header)
+            except (
+                Image.DecompressionBombError, Image.DecompressionBombWarning
+            ):
+                self.error = too_many_pixels()
+                return None
+            if size:
+                self.size_known = True
+                self.header = b''
+                self.error = image_too_large(size)
+                if self.error:
+                    return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not self.error:
+            return None
+        rejected = SimpleUploadedFile(self.file_name, b'', self.content_type)
+        rejected.upload_error = self.error
+        return rejected
+
+
+def downscale_image(uploaded):
+    """Уменьшает картинку до POST_IMAGE_MAX_SIDE по большей стороне.
+
+    Возвращает новый файл или исходный, если уменьшать не нужно.
+    Анимированные картинки не трогаются, чтобы не потерять кадры.
+    """
+    uploaded.seek(0)
+    with Image.open(uploaded) as image:
+        max_side = settings.POST_IMAGE_MAX_SIDE
+        if max(image.size) <= max_side or getattr(image, 'is_animated', 0):
+            uploaded.seek(0)
+            return uploaded
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, image_format, quality=90, optimize=True)
+    name = os.path.basename(uploaded.name)
+    return SimpleUploadedFile(
+        name, output.getvalue(), getattr(uploaded, 'content_type', None)
+    )
@@ -1,42 +1,52 @@
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Comment, Follow, Group, Post, User
+from core.paginators import CursorPaginator
+from .cache import cache_feed, conditional_feed
+from .models import (AuthorStats, Comment, Follow, Group, Post,
+                     TimelineEntry, User)
 from .forms import PostForm, CommentForm
+from .search import search_posts
+from .thumbnails import enqueue_thumbnails
 from django.conf import settings
 
 
-@cache_page(settings.CACHES_LIMIT)
+def get_page_obj(request, posts_list, window=None):
+    """Возвращает страницу ленты по курсору из GET-параметров
+    after/before.
+    """
+    paginator = CursorPaginator(
+        posts_list, settings.PAGES_LIMIT, window=window
+    )
+    return paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+
+@cache_feed('index')
 def index(request):
     """Сохраняем в posts объекты модели Post,
     отсортированные по полю pub_date по убыванию.
     """
-    posts_list = Post.objects.all()
-    # post = Post.objects.filter()
-    # num_comments = post.filter(id=post.id).comments.count()
-    # num_comment = Comment.objects.annotate(num_comment=Count('id'))
-    # num_comments = Post.objects.all()
-    paginator = Paginator(posts_list, settings.PAGES_LIMIT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts_list = Post.objects.select_related('author', 'group')
+    page_obj = get_page_obj(request, posts_list)
     context = {
         'page_obj': page_obj,
-        # 'num_comments': num_comments,
     }
     return render(request, 'posts/index.html', context)
 
 
+@cache_feed('group:{slug}')
 def group_posts(request, slug):
     """View-функция для страницы сообщества.
     Страница с информацией о постах отфильтрованных по группам.
     Принимает параметр slug из path()
     """
     groups_list = get_object_or_404(Group, slug=slug)
-    posts_list = groups_list.posts.select_related('author')
-    paginator = Paginator(posts_list, settings.PAGES_LIMIT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts_list = groups_list.posts.select_related('author', 'group')
+    page_obj = get_page_obj(request, posts_list)
     context = {
         'group': groups_list,
         'page_obj': page_obj,
@@ -44,35 +54,62 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@cache_feed('author:{username}')
 def profile(request, username):
     """View-функция для отображения профиля пользователя.
     Принимает параметр username из path()
     """
-    author = get_object_or_404(User, username=username)
-    posts_list = Post.objects.select_related('author').filter(author=author)
-    paginator = Paginator(posts_list, settings.PAGES_LIMIT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    posts_list = Post.objects.select_related('author', 'group').filter(
+        author=author
+    )
+    page_obj = get_page_obj(request, posts_list)
     following = False
     if request.user.is_authenticated:
         following = author.following.filter(user=request.user).exists()
     context = {
         'author': author,
+        'author_stats': AuthorStats.objects.for_author(author),
         'page_obj': page_obj,
         'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def get_comments_page(request, post_id):
+    """Возвращает страницу комментариев поста, начиная после курсора
+    из GET-параметра after, от старых к новым.
+    """
+    paginator = CursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        settings.COMMENTS_LIMIT,
+        ordering=('pub_date', 'id'),
+    )
+    return paginator.get_cursor_page(after=request.GET.get('after'))
+
+
+def post_page_author(post_id):
+    """Автор поста: его лента входит в версию страницы поста,
+    на которой показано число постов автора.
+    """
+    username = Post.objects.filter(pk=post_id).values_list(
+        'author__username', flat=True
+    ).first()
+    return username and {'username': username}
+
+
+@conditional_feed('post:{post_id}', 'author:{username}',
+                  lookup=post_page_author)
 def post_detail(request, post_id):
     """View-функция для отображения отдельного поста пользователя.
     Принимает порядковый номер поста из path()
     """
-    post = get_object_or_404(Post, id=post_id)
-    posts_count = Post.objects.select_related('author').filter(
-        author=post.author
-    ).count()
-    comments = post.comments.select_related('author')
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id
+    )
+    comments = get_comments_page(request, post_id)
     form = CommentForm(
         request.POST or None,
     )
@@ -80,11 +117,59 @@ def post_detail(request, post_id):
         'post': post,
         'comments': comments,
         'form': form,
-        'posts_count': posts_count,
+        'author_stats': AuthorStats.objects.for_author(post.author),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@conditional_feed('post:{post_id}')
+def post_comments(request, post_id):
+    """Фрагмент HTML со следующей страницей комментариев поста
+    для подгрузки на странице поста. Несуществующий пост — 404.
+    """
+    comments = get_comments_page(request, post_id)
+    # Есть комментарии — есть и пост, лишний запрос не нужен.
+    if (
+        not comments.object_list
+        and not Post.objects.filter(pk=post_id).exists()
+    ):
+        raise Http404
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
+def search(request):
+    """Поиск постов по тексту постов и комментариев.
+    Результаты упорядочены по релевантности.
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        page_number = int(request.GET.get('page', 1))
+    except ValueError:
+        page_number = 1
+    # Без верхней границы OFFSET переполняется, а дальние страницы
+    # поиска всё равно никто не листает.
+    page_number = min(max(page_number, 1), settings.SEARCH_MAX_PAGES)
+    posts = search_posts(
+        query,
+        offset=(page_number - 1) * settings.PAGES_LIMIT,
+        limit=settings.PAGES_LIMIT + 1,
+    )
+    context = {
+        'query': query,
+        'posts': posts[:settings.PAGES_LIMIT],
+        'page_number': page_number,
+        'has_next': (
+            len(posts) > settings.PAGES_LIMIT
+            and page_number < settings.SEARCH_MAX_PAGES
+        ),
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     """View-функция для создания отдельного поста пользователя."""
@@ -96,6 +181,7 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         form.save()
+        enqueue_thumbnails(post)
         return redirect("posts:profile", username=post.author)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -115,6 +201,8 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            enqueue_thumbnails(post)
         return redirect("posts:post_detail", post_id=post_id)
     context = {
         'form': form,
@@ -133,17 +221,21 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
     """Выводит посты авторов, на которых подписан текущий пользователь."""
-    posts_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts_list, settings.PAGES_LIMIT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts_list = TimelineEntry.objects.posts_for(
+        request.user
+    ).select_related('author', 'group')
+    page_obj = get_page_obj(
+        request, posts_list,
+        window=TimelineEntry.objects.window_for(request.user),
+    )
     context = {
         'page_obj': page_obj,
     }
@@ -152,18 +244,24 @@ def follow_index(request):
 
 @login_required
 def profile_follow(request, username):
-    """Осуществляет подписку на автора, записывая в БД."""
+    """Осуществляет подписку на автора, записывая в БД.
+    На AJAX-запрос отвечает JSON вместо перехода на профиль.
+    """
     author = get_object_or_404(User, username=username)
     if author != request.user:
-        Follow.objects.update_or_create(author=author, user=request.user)
+        Follow.objects.follow(request.user, author)
+    if request.is_ajax():
+        return JsonResponse({'following': author != request.user})
     return redirect('posts:profile', username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    """Аннулирует подписку на автора, удаляя запись БД"""
+    """Аннулирует подписку на автора, удаляя запись БД.
+    На AJAX-запрос отвечает JSON вместо перехода на профиль.
+    """
     author = get_object_or_404(User, username=username)
-    follow = Follow.objects.filter(author=author, user=request.user)
-    if follow.exists():
-        follow.delete()
+    Follow.objects.unfollow(request.user, author)
+    if request.is_ajax():
+        return JsonResponse({'following': False})
     return redirect('posts:profile', username)
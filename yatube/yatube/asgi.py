@@ -0,0 +1,65 @@
+import os
+from http import HTTPStatus
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+from asgiref.wsgi import WsgiToAsgi  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class BoundedBody:
+    """Отвечает 413 на запросы с телом длиннее ASGI_MAX_BODY_BYTES.
+
+    WsgiToAsgi читает тело целиком (сверх 64 КБ — во временный файл)
+    и только потом вызывает Django, так что BoundedUploadHandler видит
+    файл, когда тот уже принят. Поэтому длину проверяет обёртка:
+    по Content-Length до чтения, а тело без него — пока оно приходит.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        limit = settings.ASGI_MAX_BODY_BYTES
+        length = dict(scope['headers']).get(b'content-length', b'0')
+        if not length.isdigit() or int(length) > limit:
+            return await self.reject(send)
+        received = 0
+
+        async def bounded_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get('body', b''))
+            if received > limit:
+                raise BodyTooLarge
+            return message
+
+        try:
+            await self.app(scope, bounded_receive, send)
+        except BodyTooLarge:
+            await self.reject(send)
+
+    async def reject(self, send):
+        await send({
+            'type': 'http.response.start',
+            'status': HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            'headers': [(b'content-type', b'text/plain; charset=utf-8')],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': 'Слишком большой запрос.'.encode(),
+        })
+
+
+# Django 2.2 не поддерживает ни ASGI, ни асинхронные view, а его ORM
+# синхронный, поэтому view остаются синхронными: WsgiToAsgi выполняет
+# их в пуле потоков цикла событий (его размер задаёт переменная
+# окружения ASGI_THREADS).
+application = BoundedBody(WsgiToAsgi(get_wsgi_application()))
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
     'debug_toolbar',
 ]
@@ -42,6 +43,8 @@ INTERNAL_IPS = [
 ]
 
 MIDDLEWARE = [
+    'core.instrumentation.RequestStatsMiddleware',
+    'core.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,7 +60,8 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, учитывающий время рендера в замерах запроса.
+        'BACKEND': 'core.instrumentation.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -68,20 +72,61 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 # Добавлен конеткст-процессор
                 'core.context_processors.year.year',
+                'core.context_processors.cache.cache_limits',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
+ASGI_APPLICATION = 'yatube.asgi.application'
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Прагмы каждого нового соединения с SQLite (core.signals). WAL
+# не блокирует чтение на время записи, а с synchronous=NORMAL запись
+# не ждёт fsync на каждой транзакции, только на контрольных точках.
+# cache_size — в КиБ, если отрицательный; busy_timeout — в мс.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64 * 1024,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Реплики для чтения (core.routers). Локально это копии db.sqlite3,
+# которые обновляет команда sync_replicas; их число задаёт переменная
+# окружения YATUBE_SQLITE_REPLICAS. Запросы на чтение моделей из
+# REPLICA_READ_APPS идут в реплики, кроме чтений посетителя в течение
+# REPLICA_PIN_SECONDS после его записи и лент, изменившихся за это
+# время, — REPLICA_PIN_SECONDS должно быть больше отставания реплик.
+DATABASE_REPLICAS = [
+    f'replica{number}'
+    for number in range(
+        1, int(os.environ.get('YATUBE_SQLITE_REPLICAS', 0)) + 1
+    )
+]
+DATABASES.update({
+    alias: {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, f'db.{alias}.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    }
+    for alias in DATABASE_REPLICAS
+})
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_READ_APPS = ['posts', 'auth']
+REPLICA_PIN_SECONDS = 5
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -136,10 +181,101 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 PAGES_LIMIT = 10
-CACHES_LIMIT = 20
+# Комментарии на странице поста и в каждой подгружаемой порции.
+COMMENTS_LIMIT = 50
+# Постов в лентах RSS и Atom.
+FEED_ITEMS = 20
+# Дальше этой страницы результаты поиска не листаются.
+SEARCH_MAX_PAGES = 100
+# Наибольший размер страницы JSON API (?limit=).
+API_MAX_LIMIT = 100
+# Страницы лент сбрасываются по событиям (posts.cache), поэтому живут долго.
+CACHES_LIMIT = 60 * 60 * 3
+# Карточки постов меняют ключ при правке поста и его группы.
+CARD_CACHE_LIMIT = 60 * 60 * 24
+
+# Лента подписок: сколько постов хранится у читателя и с какого числа
+# подписчиков посты автора не раскладываются по лентам, а подмешиваются
+# при чтении.
+TIMELINE_LENGTH = 1000
+TIMELINE_FANOUT_LIMIT = 10000
+
+# Потоки, в которых создаются миниатюры новых картинок постов;
+# 0 — создавать сразу после сохранения поста в потоке запроса.
+THUMBNAIL_WORKERS = 2
+
+# Бюджеты SQL-запросов view (core.instrumentation). Превышение пишется
+# в лог yatube.requests, а при QUERY_BUDGETS_ENFORCE — исключение;
+# его включает для всех тестов TEST_RUNNER.
+QUERY_BUDGETS = {
+    'posts:index': 3,
+    'posts:group_list': 4,
+    'posts:profile': 5,
+    'posts:post_detail': 6,
+    'posts:follow_index': 5,
+    'posts:post_comments': 3,
+    'posts:index_rss': 3,
+    'posts:index_atom': 3,
+    'posts:group_rss': 4,
+    'posts:group_atom': 4,
+    'posts:author_rss': 4,
+    'posts:author_atom': 4,
+    'posts:search': 6,
+    'posts:post_create': 14,
+    'posts:post_edit': 12,
+    'posts:add_comment': 11,
+    'posts:profile_follow': 13,
+    'posts:profile_unfollow': 10,
+    'api:posts': 3,
+    'api:post': 3,
+    'api:post_comments': 4,
+    'api:group_posts': 4,
+    'api:author': 3,
+    'api:author_posts': 4,
+    'api:follow': 4,
+}
+QUERY_BUDGETS_ENFORCE = False
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# Метрики Prometheus на /metrics (core.metrics). При нескольких
+# WSGI-процессах METRICS_DIR — общий для них каталог, куда каждый
+# процесс раз в METRICS_FLUSH_INTERVAL секунд сбрасывает свои значения.
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 5
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Бюджет загрузки: файлы длиннее UPLOAD_MAX_BYTES и картинки больше
+# UPLOAD_MAX_PIXELS отклоняются, пока приходят. Оригиналы картинок
+# постов уменьшаются до POST_IMAGE_MAX_SIDE по большей стороне.
+UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+UPLOAD_MAX_PIXELS = 40 * 1000 * 1000
+POST_IMAGE_MAX_SIDE = 1920
+# Под ASGI тело запроса читается целиком до Django и его обработчиков
+# загрузки, поэтому тело длиннее ASGI_MAX_BODY_BYTES (файл и 1 МБ
+# остальных полей формы) отклоняется ещё при чтении (yatube.asgi).
+ASGI_MAX_BODY_BYTES = UPLOAD_MAX_BYTES + 1024 * 1024
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploads.BoundedUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
 
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    # Хранилище ключей sorl-thumbnail: отдельный кэш без срока жизни,
+    # чтобы страницы лент не вытесняли записи о миниатюрах.
+    # В продакшене указывает на общий для процессов memcached/redis.
+    'thumbnails': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'thumbnails',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
+
+THUMBNAIL_KVSTORE = 'sorl.thumbnail.kvstores.cached_db_kvstore.KVStore'
+THUMBNAIL_CACHE = 'thumbnails'